@@ -18,8 +18,7 @@ variable = sys.argv[2]
 # Open file
 f = pt.vlsvfile.VlsvReader(filename)
 
-# Read our field and cellIDs to sort it
-cellids = f.read_variable("CellID")
+# Read our field
 a = f.read_variable(variable)
 
 if len(a.shape) > 1:
@@ -28,11 +27,8 @@ if len(a.shape) > 1:
     else:
         a = numpy.sqrt( numpy.sum(a*a,1))
 
-xsize = f.read_parameter("xcells_ini")
-ysize = f.read_parameter("ycells_ini")
-
 # Sort the Field to be a proper 2D numpy-array
-a = a[cellids.argsort()].reshape([ysize,xsize])
+a = f.read_variable_grid(a)
 
 # 2D fourier-transform it.
 af = numpy.fft.fftshift(numpy.fft.fft2(a))
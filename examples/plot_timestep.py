@@ -33,19 +33,14 @@ hot_desaturated_colormap = matplotlib.colors.LinearSegmentedColormap.from_list("
 xsize = f.read_parameter("xcells_ini")
 ysize = f.read_parameter("ycells_ini")
 zsize = f.read_parameter("zcells_ini")
-cellids = f.read_variable("CellID")
 
-# Juggle fields into correct order
-rho = f.read_variable("rho")
-rho = rho[cellids.argsort()].reshape([ysize,xsize])
+# Read fields sorted into the 2d grid
+rho = f.read_variable_grid("rho")
 
-B = f.read_variable("B")
-#B = f.read_variable("perturbed_B") + f.read_variable("B")
-B_mag = np.array([np.linalg.norm(v) for v in B])
-B_mag = B_mag[cellids.argsort()].reshape([ysize,xsize])
+B_mag = f.read_variable_grid("B", operator="magnitude")
+#B_mag = f.read_variable_grid(np.sqrt(np.sum((f.read_variable("perturbed_B") + f.read_variable("B"))**2, axis=1)))
 
-boundary_type = f.read_variable("Boundary_type");
-boundary_type = boundary_type[cellids.argsort()].reshape([ysize,xsize])
+boundary_type = f.read_variable_grid("Boundary_type");
 boundary_type = (boundary_type != 1)
 
 maskedrho = ma.masked_array(rho,mask=boundary_type)
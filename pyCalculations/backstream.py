@@ -9,11 +9,7 @@ def extract_velocity_cells_sphere( vlsvReader, cellid, origin, radius ):
        :returns: Non backstream velocity cells and their avgs values as [vcellids, avgs]
    '''
    # Read the velocity cells:
-   velocity_cell_data = vlsvReader.read_velocity_cells(cellid)
-   # Get cells:
-   vcellids = velocity_cell_data.keys()
-   # Get avgs data:
-   avgs = velocity_cell_data.values()
+   [vcellids, avgs] = vlsvReader.read_velocity_cells_array(cellid)
    # Get a list of velocity coordinates shifted by the solar wind bulk velocity:
    origin = np.array(origin)
    v = vlsvReader.get_velocity_cell_coordinates(vcellids) - origin
@@ -23,9 +19,9 @@ def extract_velocity_cells_sphere( vlsvReader, cellid, origin, radius ):
    radius2 = radius**2
    condition = (radiuses <= radius2)
    # Get the velocity cells of sphere
-   vcellids_sphere = np.extract(condition, vcellids)
+   vcellids_sphere = vcellids[condition]
    # Get the avgs
-   avgs_sphere = np.extract(condition, avgs)
+   avgs_sphere = avgs[condition]
    # Return
    return [vcellids_sphere, avgs_sphere]
 
@@ -38,11 +34,7 @@ def extract_velocity_cells_non_sphere( vlsvReader, cellid, origin, radius ):
        :returns: Non backstream velocity cells and their avgs values as [vcellids, avgs]
    '''
    # Read the velocity cells:
-   velocity_cell_data = vlsvReader.read_velocity_cells(cellid)
-   # Get cells:
-   vcellids = velocity_cell_data.keys()
-   # Get avgs data:
-   avgs = velocity_cell_data.values()
+   [vcellids, avgs] = vlsvReader.read_velocity_cells_array(cellid)
    # Get a list of velocity coordinates shifted by the solar wind bulk velocity:
    origin = np.array(origin)
    v = vlsvReader.get_velocity_cell_coordinates(vcellids) - origin
@@ -52,8 +44,8 @@ def extract_velocity_cells_non_sphere( vlsvReader, cellid, origin, radius ):
    radius2 = radius**2
    condition = (radiuses > radius2)
    # Get the velocity cells of nonsphere
-   vcellids_nonsphere = np.extract(condition, vcellids)
+   vcellids_nonsphere = vcellids[condition]
    # Get the avgs
-   avgs_nonsphere = np.extract(condition, avgs)
+   avgs_nonsphere = avgs[condition]
    # Return
    return [vcellids_nonsphere, avgs_nonsphere]
@@ -19,7 +19,7 @@ from intpol_points import vlsv_intpol_points
 from cutthrough import cut_through
 from fourier import fourier
 from variable import VariableInfo
-from timeevolution import cell_time_evolution
+from timeevolution import cell_time_evolution, cell_time_evolution_files
 from pitchangle import pitch_angles
 #from backstream import extract_velocity_cells_sphere, extract_velocity_cells_non_sphere
 from gyrophaseangle import gyrophase_angles_from_file
@@ -33,8 +33,6 @@ def static_field_tracer( vlsvReader, x0, max_iterations, dx, direction='+' ):
        :returns:                  Field points in array format [x0,x1,x2,x3]
    '''
    f = vlsvReader
-   # Read cellids in order to sort variables
-   cellids = vlsvReader.read_variable("CellID")
    xsize = f.read_parameter("xcells_ini")
    ysize = f.read_parameter("ycells_ini")
    zsize = f.read_parameter("zcells_ini")
@@ -58,15 +56,11 @@ def static_field_tracer( vlsvReader, x0, max_iterations, dx, direction='+' ):
    if zsize <= 1:
       indices = [1,0]
 
-   # Read face_B:
-   face_B = f.read_variable("B")
-   face_Bx = face_B[:,0]
-   face_By = face_B[:,1]
-   face_Bz = face_B[:,2]
-
-   face_Bx = face_Bx[cellids.argsort()].reshape(sizes[indices])
-   face_By = face_By[cellids.argsort()].reshape(sizes[indices])
-   face_Bz = face_Bz[cellids.argsort()].reshape(sizes[indices])
+   # Read face_B sorted into the 2d grid:
+   face_B = f.read_variable_grid("B")
+   face_Bx = face_B[...,0]
+   face_By = face_B[...,1]
+   face_Bz = face_B[...,2]
 
    face_B = np.array([face_Bx, face_By, face_Bz])
 
@@ -19,8 +19,8 @@ def gyrophase_angles_from_file( vlsvReader, cellid):
    pl.hist(result[0].data, weights=result[1].data, bins=100, log=False)
    '''
    # Read the velocity cells:
-   velocity_cell_data = vlsvReader.read_velocity_cells(cellid)
-   if velocity_cell_data == []:
+   [vcellids, avgs] = vlsvReader.read_velocity_cells_array(cellid)
+   if len(vcellids) == 0:
       from output import output_1d
       return output_1d([[0.0, 1.0], [1.0, 1.0]], ["Gyrophase_angle", "avgs"], ["", ""])
    # Read bulk velocity:
@@ -47,11 +47,9 @@ def gyrophase_angles_from_file( vlsvReader, cellid):
    else:
       from output import output_1d
       return output_1d([[0.0, 1.0], [1.0, 1.0]], ["Gyrophase_angle", "avgs"], ["", ""])
-   # Get cells:
-   vcellids = velocity_cell_data.keys()
    # Get a list of velocity coordinates:
    velocity_coordinates = vlsvReader.get_velocity_cell_coordinates(vcellids)
-   return gyrophase_angles(bulk_velocity, B_unit, velocity_cell_data, velocity_coordinates)
+   return gyrophase_angles(bulk_velocity, B_unit, avgs, velocity_coordinates)
 
 
 
@@ -60,6 +58,7 @@ def gyrophase_angles(bulk_velocity, B_unit, velocity_cell_data, velocity_coordin
    
    :param bulk_velocity: TODO
    :param B_unit: TODO
+   :param velocity_cell_data: values of the velocity cells (see read_velocity_cells_array in vlsvReader), or a dict from read_velocity_cells
    :param velocity_coordinates: TODO
    :param cosine:            True if returning the gyrophase angles as a cosine plot
    :param plasmaframe:       True if the user wants to get the gyrophase angle distribution in the plasma frame, default True
@@ -76,7 +75,10 @@ def gyrophase_angles(bulk_velocity, B_unit, velocity_cell_data, velocity_coordin
    '''
    
    # Get avgs data:
-   avgs = velocity_cell_data.values()
+   if isinstance(velocity_cell_data, dict):
+      avgs = velocity_cell_data.values()
+   else:
+      avgs = velocity_cell_data
    # Shift to plasma frame
    if plasmaframe == True:
       velocity_coordinates = velocity_coordinates - bulk_velocity
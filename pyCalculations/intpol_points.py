@@ -42,6 +42,9 @@ def vlsv_intpol_points(vlsvReader,points,varlist,operator="pass",interpolation_o
       print "ERROR: len(points) = 0"
       return
    header = "x y z " # header string
+   points = np.atleast_2d(points)
+   cellids = vlsvReader.get_cellid(points)
+   inside = (cellids != 0) # points out of domain get nan values
    for i in range(N_vars): # loop variable list
       var = varlist[i]
       if vlsvReader.check_variable(var) == False:
@@ -51,16 +54,12 @@ def vlsv_intpol_points(vlsvReader,points,varlist,operator="pass",interpolation_o
       if dim <= 0:
          print "ERROR: bad variable dimension (dim=" + str(dim) + ")"
          return
-      values=np.zeros((N_points,dim))
-      crds=np.zeros((N_points,3)) # coordinates
-      for j in range(N_points):
-         if vlsvReader.get_cellid(points[j]) == 0: # coordinates of a point out of domain
-            values[j]=np.ones(dim)*np.nan
-         elif interpolation_order==1:
-            values[j]=vlsvReader.read_interpolated_variable(var,points[j],operator)
-         elif interpolation_order==0:
-            values[j]=vlsvReader.read_variable(var,vlsvReader.get_cellid(points[j]),operator)
-         crds[j]=points[j]
+      values=np.ones((N_points,dim))*np.nan
+      crds=np.array(points, dtype=float) # coordinates
+      if interpolation_order==1:
+         values=np.reshape(vlsvReader.read_interpolated_variable(var,points,operator),(N_points,dim))
+      elif interpolation_order==0 and np.any(inside):
+         values[inside]=np.reshape(vlsvReader.read_variable(var,cellids[inside],operator),(-1,dim))
       if i==0:
          res=values
       else:
@@ -40,25 +40,20 @@ def lineout( vlsvReader, point1, point2, variable, operator="pass",interpolation
    if vlsvReader.get_cellid(point2) == 0:
       print "ERROR, POINT2 IN CUT-THROUGH OUT OF BOUNDS!"
 
-   value_len=len(np.atleast_1d(vlsvReader.read_interpolated_variable( variable, point1, operator)))
-   
-   if value_len==1:
-      values=np.zeros(points)
-   else:
-      values=np.zeros((points,value_len))
-
-   distance=np.zeros(points)
-   coordinates=np.zeros((points,3))
-   
-   for i in range(points):
-      relative_coordinate=(point2 - point1) * i / (points-1)
-      if interpolation_order==1:
-         values[i]=vlsvReader.read_interpolated_variable( variable, point1 + relative_coordinate, operator)
-      elif interpolation_order==0:
-         values[i]=vlsvReader.read_variable(variable, vlsvReader.get_cellid(point1 + relative_coordinate), operator)
-
-      distance[i]=np.sqrt(sum(relative_coordinate**2))
-      coordinates[i]=point1 +  relative_coordinate
+   relative_coordinates=(point2 - point1) * np.arange(points)[:,np.newaxis] / (points-1)
+   distance=np.sqrt(np.sum(relative_coordinates**2, axis=1))
+   coordinates=point1 + relative_coordinates
+
+   # All points are interpolated or read at once, points out of bounds get nan values
+   if interpolation_order==1:
+      values=vlsvReader.read_interpolated_variable( variable, coordinates, operator)
+   elif interpolation_order==0:
+      cellids=vlsvReader.get_cellid(coordinates)
+      inside=(cellids != 0)
+      inside_values=vlsvReader.read_variable(variable, cellids[inside], operator)
+      values=np.zeros((points,) + np.shape(inside_values)[1:])
+      values[:]=np.nan
+      values[inside]=inside_values
 
    return (distance,coordinates,values)
 
@@ -21,7 +21,7 @@ def pitch_angles( vlsvReader, cellid, cosine=True, plasmaframe=False ):
           pl.hist(result[0].data, weights=result[1].data, bins=100, log=False)
    '''
    # Read the velocity cells:
-   velocity_cell_data = vlsvReader.read_velocity_cells(cellid)
+   [vcellids, avgs] = vlsvReader.read_velocity_cells_array(cellid)
    # Read bulk velocity:
    if vlsvReader.read_variable("rho", cellid) != 0.0:
       bulk_velocity = np.array(vlsvReader.read_variable("rho_v", cellid) / vlsvReader.read_variable("rho", cellid), copy=False)
@@ -30,10 +30,6 @@ def pitch_angles( vlsvReader, cellid, cosine=True, plasmaframe=False ):
    # Calculate the pitch angles for the data:
    B = vlsvReader.read_variable("B", cellid)
    B_unit = B / np.linalg.norm(B)
-   # Get cells:
-   vcellids = velocity_cell_data.keys()
-   # Get avgs data:
-   avgs = velocity_cell_data.values()
    # Get a list of velocity coordinates:
    if plasmaframe == True:
       v = vlsvReader.get_velocity_cell_coordinates(vcellids) - bulk_velocity
@@ -18,6 +18,22 @@ def rotateTensorToVector( Tensor, vector ):
    Tensor_rotated = R.dot(Tensor).dot(R.transpose())
    return Tensor_rotated
 
+def rotateTensorsToVectors( Tensors, vectors ):
+   '''
+      Rotates an array of tensors, each with the rotation matrix that would align the corresponding vector with the z-axis (see :func:`rotateTensorToVector`)
+
+      :param Tensors:         Array of tensors to be rotated, shape (N,3,3)
+      :param vectors:         Array of vectors for creating the rotation matrices, shape (N,3)
+      :returns: array of rotated tensors, shape (N,3,3)
+   '''
+   vectors = np.asarray(vectors)
+   vectors_u = np.cross(vectors, np.array([0,0,1]))
+   vectors_u = vectors_u / np.sqrt(np.sum(vectors_u**2, axis=-1))[:,None]
+   angles = np.arccos( vectors[:,2] / np.sqrt(np.sum(vectors**2, axis=-1)) )
+   R = rotation_matrices( vectors_u, angles )
+   # Rotate Tensors: R.Tensor.R^T for every tensor
+   return np.einsum('nij,njk,nlk->nil', R, Tensors, R)
+
 def rotateVectorToVector( vector1, vector2 ):
    ''' Applies rotation matrix that would rotate vector2 to z-axis on vector1 and then returns the rotated vector1
 
@@ -53,3 +69,22 @@ def rotation_matrix(vector, angle):
                  [v[0]*v[1]*(1-np.cos(t))+v[2]*np.sin(t), np.cos(t)+v[1]**2*(1-np.cos(t)), v[1]*v[2]*(1-np.cos(t))-v[0]*np.sin(t)],
                  [v[0]*v[2]*(1-np.cos(t))-v[1]*np.sin(t), v[2]*v[1]*(1-np.cos(t))+v[0]*np.sin(t), np.cos(t)+v[2]**2*(1-np.cos(t))]])
    return m
+
+def rotation_matrices(vectors, angles):
+   ''' Creates an array of rotation matrices, see :func:`rotation_matrix`
+       :param vectors       Array of unit vectors, shape (N,3)
+       :param angles        Array of angles, shape (N,)
+       :returns an array of rotation matrices, shape (N,3,3)
+   '''
+   v = np.asarray(vectors)
+   c = np.cos(angles)[:,None,None]
+   s = np.sin(angles)[:,None,None]
+   # Cross product matrices of the vectors
+   cross = np.zeros((len(v),3,3))
+   cross[:,0,1] = -v[:,2]
+   cross[:,0,2] = v[:,1]
+   cross[:,1,0] = v[:,2]
+   cross[:,1,2] = -v[:,0]
+   cross[:,2,0] = -v[:,1]
+   cross[:,2,1] = v[:,0]
+   return c*np.identity(3) + s*cross + (1-c)*np.einsum('ni,nj->nij', v, v)
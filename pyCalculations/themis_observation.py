@@ -237,16 +237,14 @@ def themis_observation_from_file( vlsvReader, cellid, matrix=np.array([[1,0,0],[
    dvx,dvy,dvz = get_dv(vlsvReader)
 
    # Read the velocity cells:
-   velocity_cell_data = vlsvReader.read_velocity_cells(cellid)
-   if velocity_cell_data == []:
+   [vcellids, avgs] = vlsvReader.read_velocity_cells_array(cellid)
+   if len(vcellids) == 0:
       # No velocity space data here, return empty result
       return [[],[],0,0,[]]
    # Calculate the detector histogram
-   # Get cells:
-   vcellids = velocity_cell_data.keys()
    # Get a list of velocity coordinates:
    velocity_coordinates = vlsvReader.get_velocity_cell_coordinates(vcellids)
-   angles,energies,detector_values = themis_observation(velocity_cell_data, velocity_coordinates,matrix,dvx,countrates=countrates, interpolate=interpolate, noise=noise, binOffset=binOffset)
+   angles,energies,detector_values = themis_observation(avgs, velocity_coordinates,matrix,dvx,countrates=countrates, interpolate=interpolate, noise=noise, binOffset=binOffset)
 
    # Calc min and max
    val_min = np.min(detector_values)
@@ -258,7 +256,7 @@ def themis_observation_from_file( vlsvReader, cellid, matrix=np.array([[1,0,0],[
 def themis_observation(velocity_cell_data, velocity_coordinates, matrix, dv=30e3, countrates=True, interpolate=True, binOffset=[0.,0.], noise=False):
    ''' Calculates artificial THEMIS EMS observation from the given velocity space data
 
-   :param velocity_cell_data: velocity cell information as obtained from vlsvReader
+   :param velocity_cell_data: velocity cell values as obtained from vlsvReader.read_velocity_cells_array, or a dict from vlsvReader.read_velocity_cells
    :param velocity_coordinates: coordinates associated with the cells
    :param matrix: Matrix to transform velocities from simulation space into detector space (use simulation_to_spacecraft_frame helper function)
    :param dv: velocity space resolution (in km/s)
@@ -281,7 +279,10 @@ def themis_observation(velocity_cell_data, velocity_coordinates, matrix, dv=30e3
    '''
 
    # Get avgs data:
-   avgs = velocity_cell_data.values()
+   if isinstance(velocity_cell_data, dict):
+      avgs = velocity_cell_data.values()
+   else:
+      avgs = velocity_cell_data
    # Shift to plasma frame
    #if plasmaframe == True:
    #   velocity_coordinates = velocity_coordinates - bulk_velocity
@@ -58,12 +58,12 @@ def cell_time_evolution( vlsvReader_list, variables, cellids, units="" ):
       for j in xrange(len(variables)):
          variable = variables[j]
          # Read the variable for all cell ids
-         #variables_for_cellids = vlsvReader.read_variables_for_cellids( variable, cellids )
+         variables_for_cellids = vlsvReader.read_variable( variable, cellids )
          # Save the data into the right slot in the data array:
          for i in xrange(len(cellids)):
-            data[len(parameters)+i*len(variables)+j].append(vlsvReader.read_variable( variable, cellids[i] ))
+            data[len(parameters)+i*len(variables)+j].append(variables_for_cellids[i])
       # For optimization purposes we are now freeing vlsvReader's memory
-      # Note: Upon reading data vlsvReader created an internal hash map that takes a lot of memory
+      # Note: Upon reading data vlsvReader created an internal cell id index that takes memory
       vlsvReader.optimize_clear_fileindex_for_cellid()
       # Close the vlsv reader's file:
       vlsvReader.optimize_close_file()
@@ -73,3 +73,88 @@ def cell_time_evolution( vlsvReader_list, variables, cellids, units="" ):
                      parameter_units + [units[(int)(i)%(int)(len(units))] for i in xrange(len(data)-len(parameters))] )
 
 
+def _read_cells_from_file( task ):
+   ''' Reads the time, the time step and the given variables of the given cells from a file (used by the worker processes of cell_time_evolution_files)
+   '''
+   from vlsvreader import VlsvReader
+   (file_name, variables, cellids) = task
+   vlsvReader = VlsvReader(file_name)
+   vlsvReader.optimize_open_file()
+   try:
+      t = vlsvReader.read_parameter("t")
+      if t is None:
+         t = vlsvReader.read_parameter("time")
+      tstep = vlsvReader.read_parameter("tstep")
+      if tstep is None:
+         tstep = vlsvReader.read_parameter("timestep")
+      # Files without a time can not be ordered in time
+      if t is None:
+         raise ValueError("No t or time parameter in " + file_name)
+      if tstep is None:
+         raise ValueError("No tstep or timestep parameter in " + file_name)
+      # Read the cells of all variables with one gather per variable
+      data = vlsvReader.read_variables(variables, cellids)
+   finally:
+      vlsvReader.optimize_close_file()
+   return (t, tstep, [np.array(x) for x in data])
+
+def cell_time_evolution_files( file_names, variables, cellids, processes=None ):
+   ''' Returns variable data from a time evolution of some certain cell ids, reading the files in a pool of processes
+
+       :param file_names:              List of the vlsv file names
+       :param variables:               Name of the variables
+       :param cellids:                 List of cell ids
+       :param processes:               Number of worker processes, None for one per cpu and 1 for reading the files in this process
+       :returns: a list [t, tstep, data of variables[0], data of variables[1], ..], where t and tstep have the shape (number of files,) and the data of each variable the shape (number of files, number of cells) + the shape of the variable, ordered by time
+
+       .. code-block:: python
+
+          import pytools as pt; import pylab as pl
+          # Example of usage:
+          file_names = pt.miscellaneous.get_sorted_file_names("bulk.*.vlsv")
+          [t, tstep, rho, B] = pt.calculations.cell_time_evolution_files( file_names, variables=["rho", "B"], cellids=[2,4], processes=16 )
+
+          # Plot the Bx of the second cell:
+          pl.plot(t, B[:,1,0])
+          pl.show()
+
+       .. seealso:: :func:`cell_time_evolution`
+   '''
+   variables = list(np.atleast_1d(variables))
+   results = read_cells_from_files( file_names, variables, cellids, processes )
+   t = np.array([result[0] for result in results], dtype=float)
+   tstep = np.array([result[1] for result in results])
+   # Order the files by time
+   order = np.argsort(t, kind="mergesort")
+   data = [t[order], tstep[order]]
+   for j in xrange(len(variables)):
+      data.append(np.array([results[i][2][j] for i in order]))
+   return data
+
+def read_cells_from_files( file_names, variables, cellids, processes=None ):
+   ''' Reads the time, the time step and the given variables of the given cells from every file in a pool of processes
+
+       :param file_names:              List of the vlsv file names
+       :param variables:               List of the names of the variables
+       :param cellids:                 List of cell ids
+       :param processes:               Number of worker processes, None for one per cpu and 1 for reading the files in this process
+       :returns: a list of (t, tstep, [data of each variable]) in the order of file_names
+
+       The time is read from the t or time parameter and the time step from the tstep or timestep parameter. A ValueError is raised
+       if a file has neither.
+
+       .. seealso:: :func:`cell_time_evolution_files`
+   '''
+   tasks = [(file_name, list(variables), np.atleast_1d(cellids)) for file_name in file_names]
+   if processes == 1:
+      return map(_read_cells_from_file, tasks)
+   import multiprocessing
+   pool = multiprocessing.Pool(processes)
+   try:
+      results = pool.map(_read_cells_from_file, tasks, chunksize=1)
+      pool.close()
+   finally:
+      pool.terminate()
+      pool.join()
+   return results
+
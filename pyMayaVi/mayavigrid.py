@@ -121,6 +121,7 @@ class MayaviGrid(HasTraits):
       '''
       HasTraits.__init__(self, **traits)
       self.vlsvReader = vlsvReader
+      self.__vlasiatorReader = None
       self.engine_view = EngineView(engine=self.scene.engine)
       self.__engine = self.scene.engine
       self.__picker = []
@@ -217,19 +218,8 @@ class MayaviGrid(HasTraits):
       mins = np.array([self.vlsvReader.read_parameter("xmin"), self.vlsvReader.read_parameter("ymin"), self.vlsvReader.read_parameter("zmin")])
       cells = np.array([self.vlsvReader.read_parameter("xcells_ini"), self.vlsvReader.read_parameter("ycells_ini"), self.vlsvReader.read_parameter("zcells_ini")])
       maxs = np.array([self.vlsvReader.read_parameter("xmax"), self.vlsvReader.read_parameter("ymax"), self.vlsvReader.read_parameter("zmax")])
-      # Get the variables:
-      index_for_cellid_dict = self.vlsvReader.get_cellid_locations()
-      if isinstance(variable, str):
-         variable_array = self.vlsvReader.read_variable( name=variable, operator=operator )
-      else:
-         variable_array = variable
-      # Sort the dictionary by cell id
-      import operator as oper
-      sorted_index_for_cellid_dict = sorted(index_for_cellid_dict.iteritems(), key=oper.itemgetter(0))
-      # Add the variable values:
-      variable_array_sorted = []
-      for i in sorted_index_for_cellid_dict:
-         variable_array_sorted.append(variable_array[i[1]])
+      # Get the variables sorted by cell id:
+      variable_array_sorted = self.vlsvReader.read_variable_grid( variable, operator=operator, collapse=False ).ravel()
       # Store the mins and maxs:
       self.__mins = mins
       self.__maxs = maxs
@@ -241,6 +231,16 @@ class MayaviGrid(HasTraits):
       else:
          self.__generate_grid( mins=mins, maxs=maxs, cells=cells, datas=variable_array_sorted, names=variable )
 
+   def __get_nearest_cellid_with_distribution( self, cellid ):
+      ''' Returns the nearest cell id with a velocity distribution, using the spatial index of a VlasiatorReader
+      '''
+      if self.__vlasiatorReader is None:
+         if isinstance(self.vlsvReader, vlsvfile.VlasiatorReader):
+            self.__vlasiatorReader = self.vlsvReader
+         else:
+            self.__vlasiatorReader = vlsvfile.VlasiatorReader(self.vlsvReader.file_name)
+      return self.__vlasiatorReader.get_nearest_cellid_with_distribution( cellid )
+
    def __picker_callback( self, picker ):
       """ This gets called when clicking on a cell
       """
@@ -271,18 +271,7 @@ class MayaviGrid(HasTraits):
          self.__generate_velocity_grid(cellid)
       elif (self.picker == "Velocity_space_nearest_cellid"):
          # Find the nearest cell id with distribution:
-         # Read cell ids with velocity distribution in:
-         cell_candidates = self.vlsvReader.read(mesh = "SpatialGrid", tag = "CELLSWITHBLOCKS")
-         # Read in the coordinates of the cells:
-         cell_candidate_coordinates = [self.vlsvReader.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-         # Read in the cell's coordinates:
-         pick_cell_coordinates = self.vlsvReader.get_cell_coordinates(cellid)
-         # Find the nearest:
-         from operator import itemgetter
-         norms = np.sum((cell_candidate_coordinates - pick_cell_coordinates)**2, axis=-1)**(1./2)
-         norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-         # Get the cell id:
-         cellid = cell_candidates[i]
+         cellid = self.__get_nearest_cellid_with_distribution( cellid )
          print "PLOTTED CELL ID: " + str(cellid)
          # Set label to give out the location of the cell:
          self.__add_label( cellid )
@@ -294,18 +283,7 @@ class MayaviGrid(HasTraits):
          self.__generate_velocity_grid(cellid, True)
       elif (self.picker == "Velocity_space_nearest_cellid_iso_surface"):
          # Find the nearest cell id with distribution:
-         # Read cell ids with velocity distribution in:
-         cell_candidates = self.vlsvReader.read(mesh = "SpatialGrid", tag = "CELLSWITHBLOCKS")
-         # Read in the coordinates of the cells:
-         cell_candidate_coordinates = [self.vlsvReader.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-         # Read in the cell's coordinates:
-         pick_cell_coordinates = self.vlsvReader.get_cell_coordinates(cellid)
-         # Find the nearest:
-         from operator import itemgetter
-         norms = np.sum((cell_candidate_coordinates - pick_cell_coordinates)**2, axis=-1)**(1./2)
-         norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-         # Get the cell id:
-         cellid = cell_candidates[i]
+         cellid = self.__get_nearest_cellid_with_distribution( cellid )
          print "PLOTTED CELL ID: " + str(cellid)
          # Set label to give out the location of the cell:
          self.__add_label( cellid )
@@ -313,18 +291,7 @@ class MayaviGrid(HasTraits):
          self.__generate_velocity_grid(cellid, True)
       elif (self.picker == "Pitch_angle"):
          # Find the nearest cell id with distribution:
-         # Read cell ids with velocity distribution in:
-         cell_candidates = self.vlsvReader.read(mesh = "SpatialGrid", tag = "CELLSWITHBLOCKS")
-         # Read in the coordinates of the cells:
-         cell_candidate_coordinates = [self.vlsvReader.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-         # Read in the cell's coordinates:
-         pick_cell_coordinates = self.vlsvReader.get_cell_coordinates(cellid)
-         # Find the nearest:
-         from operator import itemgetter
-         norms = np.sum((cell_candidate_coordinates - pick_cell_coordinates)**2, axis=-1)**(1./2)
-         norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-         # Get the cell id:
-         cellid = cell_candidates[i]
+         cellid = self.__get_nearest_cellid_with_distribution( cellid )
          print "PLOTTED CELL ID: " + str(cellid)
          # Set label to give out the location of the cell:
          self.__add_label( cellid )
@@ -336,18 +303,7 @@ class MayaviGrid(HasTraits):
          pl.show()
       elif (self.picker == "Gyrophase_angle"):
          # Find the nearest cell id with distribution:
-         # Read cell ids with velocity distribution in:
-         cell_candidates = self.vlsvReader.read(mesh = "SpatialGrid", tag = "CELLSWITHBLOCKS")
-         # Read in the coordinates of the cells:
-         cell_candidate_coordinates = [self.vlsvReader.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-         # Read in the cell's coordinates:
-         pick_cell_coordinates = self.vlsvReader.get_cell_coordinates(cellid)
-         # Find the nearest:
-         from operator import itemgetter
-         norms = np.sum((cell_candidate_coordinates - pick_cell_coordinates)**2, axis=-1)**(1./2)
-         norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-         # Get the cell id:
-         cellid = cell_candidates[i]
+         cellid = self.__get_nearest_cellid_with_distribution( cellid )
          print "PLOTTED CELL ID: " + str(cellid)
          # Set label to give out the location of the cell:
          self.__add_label( cellid )
@@ -417,18 +373,7 @@ class MayaviGrid(HasTraits):
             detectoraxis = np.array([float(args[0]),float(args[1]),float(args[2])])
 
          # Find the nearest cell id with distribution:
-         # Read cell ids with velocity distribution in:
-         cell_candidates = self.vlsvReader.read(mesh = "SpatialGrid", tag = "CELLSWITHBLOCKS")
-         # Read in the coordinates of the cells:
-         cell_candidate_coordinates = [self.vlsvReader.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-         # Read in the cell's coordinates:
-         pick_cell_coordinates = self.vlsvReader.get_cell_coordinates(cellid)
-         # Find the nearest:
-         from operator import itemgetter
-         norms = np.sum((cell_candidate_coordinates - pick_cell_coordinates)**2, axis=-1)**(1./2)
-         norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-         # Get the cell id:
-         cellid = cell_candidates[i]
+         cellid = self.__get_nearest_cellid_with_distribution( cellid )
          print "PLOTTED CELL ID: " + str(cellid)
          # Set label to give out the location of the cell:
          self.__add_label( cellid )
@@ -438,18 +383,7 @@ class MayaviGrid(HasTraits):
          pl.show()
       elif (self.picker == "Themis_contour"):
          # Find the nearest cell id with distribution:
-         # Read cell ids with velocity distribution in:
-         cell_candidates = self.vlsvReader.read(mesh = "SpatialGrid", tag = "CELLSWITHBLOCKS")
-         # Read in the coordinates of the cells:
-         cell_candidate_coordinates = [self.vlsvReader.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-         # Read in the cell's coordinates:
-         pick_cell_coordinates = self.vlsvReader.get_cell_coordinates(cellid)
-         # Find the nearest:
-         from operator import itemgetter
-         norms = np.sum((cell_candidate_coordinates - pick_cell_coordinates)**2, axis=-1)**(1./2)
-         norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-         # Get the cell id:
-         cellid = cell_candidates[i]
+         cellid = self.__get_nearest_cellid_with_distribution( cellid )
          print "PLOTTED CELL ID: " + str(cellid)
          # Parse args: Plotting plane
          plane = [np.array([1.,0,0]),np.array([0,1.,0])]
@@ -487,18 +421,7 @@ class MayaviGrid(HasTraits):
       elif (self.picker == "Themis_helistyle"):
 
          # Find the nearest cell id with distribution:
-         # Read cell ids with velocity distribution in:
-         cell_candidates = self.vlsvReader.read(mesh = "SpatialGrid", tag = "CELLSWITHBLOCKS")
-         # Read in the coordinates of the cells:
-         cell_candidate_coordinates = [self.vlsvReader.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-         # Read in the cell's coordinates:
-         pick_cell_coordinates = self.vlsvReader.get_cell_coordinates(cellid)
-         # Find the nearest:
-         from operator import itemgetter
-         norms = np.sum((cell_candidate_coordinates - pick_cell_coordinates)**2, axis=-1)**(1./2)
-         norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-         # Get the cell id:
-         cellid = cell_candidates[i]
+         cellid = self.__get_nearest_cellid_with_distribution( cellid )
          print "PLOTTED CELL ID: " + str(cellid)
          # Parse args: Plotting plane
          plane = [np.array([1.,0,0]),np.array([0,1.,0])]
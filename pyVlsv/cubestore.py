@@ -0,0 +1,196 @@
+''' A store for the time series of variables in a set of cells, extracted from a series of vlsv files
+
+    A cube store is a directory with one .npy file of shape (time, cells, components) per variable, the time and time step of every
+    file in t.npy and tstep.npy and a metadata.json file with the cell ids, the variables and the extracted files. The .npy files
+    are memory mapped for reading, so time series analysis does not need to read the vlsv files again, and new files can be appended
+    to the store.
+
+    .. code-block:: python
+
+       # Example usage:
+       import pytools as pt
+       file_names = pt.miscellaneous.get_sorted_file_names("bulk.*.vlsv")
+       store = pt.vlsvfile.create_cube_store("probes.cube", file_names[:1000], ["rho", "B"], cellids=[1001, 2002, 3003])
+       # Later, when the run has continued:
+       store = pt.vlsvfile.CubeStore("probes.cube")
+       store.append(pt.miscellaneous.get_sorted_file_names("bulk.*.vlsv"))
+       # Time series of Bz in the second cell, read from the memory mapped store:
+       Bz = store.read("B")[:,1,2]
+'''
+
+import numpy as np
+import json
+import os
+import struct
+from timeevolution import read_cells_from_files
+
+# Size reserved for the .npy headers, so that the time dimension can grow without moving the data
+npy_header_size = 256
+
+def _write_npy_header( fptr, dtype, shape ):
+   ''' Writes a version 1.0 .npy header padded to npy_header_size bytes
+   '''
+   header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(np.dtype(dtype)), tuple(int(x) for x in shape))
+   header = header.ljust(npy_header_size - 10 - 1) + "\n"
+   fptr.seek(0)
+   fptr.write("\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header)
+
+def _append_npy( file_name, data ):
+   ''' Appends data along the first axis of a .npy file written with _write_npy_header, creating the file if it does not exist
+   '''
+   if os.path.isfile(file_name):
+      existing = np.load(file_name, mmap_mode="r")
+      (dtype, shape) = (existing.dtype, existing.shape)
+      del existing
+      fptr = open(file_name, "r+b")
+   else:
+      (dtype, shape) = (data.dtype, (0,) + data.shape[1:])
+      fptr = open(file_name, "w+b")
+   try:
+      # Write the data first, so that an interrupted append leaves the old shape in the header
+      fptr.seek(npy_header_size + int(np.prod(shape)) * dtype.itemsize)
+      np.ascontiguousarray(data, dtype=dtype).tofile(fptr)
+      _write_npy_header(fptr, dtype, (shape[0] + len(data),) + shape[1:])
+   finally:
+      fptr.close()
+
+def _remove_store_files( path, variables ):
+   ''' Removes the files of a cube store in the directory path, and the .npy files of the given variables, so that a new store
+       does not append to the data of an old one
+   '''
+   file_names = ["t.npy", "tstep.npy"] + [name + ".npy" for name in variables]
+   metadata_file_name = os.path.join(path, "metadata.json")
+   if os.path.isfile(metadata_file_name):
+      fptr = open(metadata_file_name, "r")
+      metadata = json.load(fptr)
+      fptr.close()
+      file_names.extend([variable["file"] for variable in metadata["variables"].values()])
+      file_names.append("metadata.json")
+   for file_name in set(file_names):
+      if os.path.isfile(os.path.join(path, file_name)):
+         os.remove(os.path.join(path, file_name))
+
+def create_cube_store( path, file_names, variables, cellids=None, bounding_box=None, processes=None, batch_size=64 ):
+   ''' Creates a cube store from a series of vlsv files
+
+       :param path:            Directory of the store, created if it does not exist. A cube store already in the directory is replaced
+       :param file_names:      List of the vlsv file names
+       :param variables:       List of the names of the variables
+       :param cellids:         List of cell ids
+       :param bounding_box:    If no cell ids are given, the cells whose centers are inside [xmin, ymin, zmin, xmax, ymax, zmax] in the first file are used
+       :param processes:       Number of worker processes reading the files, see :func:`read_cells_from_files`
+       :param batch_size:      Number of files read before writing them into the store
+       :returns: the :class:`CubeStore`
+   '''
+   if cellids is None:
+      if bounding_box is None:
+         print "Give either cellids or bounding_box at create_cube_store"
+         return
+      from vlsvreader import VlsvReader
+      cellids = VlsvReader(file_names[0]).get_cellids_in_box(bounding_box)
+   if not os.path.isdir(path):
+      os.makedirs(path)
+   else:
+      _remove_store_files(path, variables)
+   metadata = {}
+   metadata["cellids"] = [int(cellid) for cellid in np.atleast_1d(cellids)]
+   metadata["variables"] = {}
+   metadata["variable_order"] = list(variables)
+   metadata["files"] = []
+   store = CubeStore(path, metadata=metadata)
+   store.append(file_names, processes=processes, batch_size=batch_size)
+   return store
+
+class CubeStore(object):
+   ''' Class for reading and appending to a cube store, see :func:`create_cube_store`
+   '''
+   def __init__(self, path, metadata=None):
+      ''' Opens an existing cube store
+
+          :param path:         Directory of the store
+          :param metadata:     Metadata of a new store, used by :func:`create_cube_store`
+      '''
+      self.path = path
+      if metadata is None:
+         fptr = open(os.path.join(self.path, "metadata.json"), "r")
+         metadata = json.load(fptr)
+         fptr.close()
+         self.__metadata = metadata
+      else:
+         self.__metadata = metadata
+         self.__write_metadata()
+
+   def __write_metadata(self):
+      file_name = os.path.join(self.path, "metadata.json")
+      fptr = open(file_name + ".tmp", "w")
+      json.dump(self.__metadata, fptr, indent=1)
+      fptr.close()
+      os.rename(file_name + ".tmp", file_name)
+
+   def get_cellids(self):
+      ''' Returns the cell ids of the store in the order of the cell axis
+      '''
+      return np.array(self.__metadata["cellids"])
+
+   def get_variables(self):
+      ''' Returns the names of the variables in the store
+      '''
+      return list(self.__metadata["variable_order"])
+
+   def get_file_names(self):
+      ''' Returns the names of the vlsv files in the store in the order they were appended
+      '''
+      return list(self.__metadata["files"])
+
+   def get_times(self):
+      ''' Returns the times and the time steps of the files in the store as [t, tstep]
+      '''
+      if len(self.__metadata["files"]) == 0:
+         return [np.zeros(0), np.zeros(0, dtype=int)]
+      return [np.load(os.path.join(self.path, "t.npy"), mmap_mode="r"), np.load(os.path.join(self.path, "tstep.npy"), mmap_mode="r")]
+
+   def read(self, name, components=False):
+      ''' Returns the time series of a variable as a read-only memory mapped array
+
+          :param name:         Name of the variable
+          :param components:   If True the array has the shape (time, cells, components) as stored, otherwise the components are shaped like the variable, e.g. (time, cells) for scalars and (time, cells, 3, 3) for tensors
+          :returns: the memory mapped array
+      '''
+      if name not in self.__metadata["variables"]:
+         print "Variable " + name + " is not in the cube store " + self.path
+         return
+      data = np.load(os.path.join(self.path, self.__metadata["variables"][name]["file"]), mmap_mode="r")
+      if components:
+         return data
+      return data.reshape(data.shape[:2] + tuple(self.__metadata["variables"][name]["shape"]))
+
+   def append(self, file_names, processes=None, batch_size=64):
+      ''' Appends the variables of the store from new vlsv files. Files that are already in the store are skipped
+
+          :param file_names:   List of the vlsv file names
+          :param processes:    Number of worker processes reading the files, see :func:`read_cells_from_files`
+          :param batch_size:   Number of files read before writing them into the store
+      '''
+      existing = set(self.__metadata["files"])
+      file_names = [os.path.abspath(file_name) for file_name in file_names if os.path.abspath(file_name) not in existing]
+      variables = self.__metadata["variable_order"]
+      cellids = self.get_cellids()
+      for start in xrange(0, len(file_names), batch_size):
+         batch = file_names[start:start+batch_size]
+         results = read_cells_from_files(batch, variables, cellids, processes=processes)
+         # Order the files of the batch by time
+         order = np.argsort([result[0] for result in results], kind="mergesort")
+         t = np.array([results[i][0] for i in order], dtype=float)
+         tstep = np.array([results[i][1] for i in order])
+         if len(self.__metadata["files"]) > 0 and len(t) > 0 and t[0] < self.get_times()[0][-1]:
+            print "Note: Appending files that are earlier in time than the files in the cube store " + self.path
+         for j in xrange(len(variables)):
+            name = variables[j]
+            values = np.array([results[i][2][j] for i in order])
+            if name not in self.__metadata["variables"]:
+               self.__metadata["variables"][name] = {"file": name + ".npy", "shape": list(values.shape[2:])}
+            _append_npy(os.path.join(self.path, self.__metadata["variables"][name]["file"]), values.reshape(len(t), len(cellids), -1))
+         _append_npy(os.path.join(self.path, "t.npy"), t)
+         _append_npy(os.path.join(self.path, "tstep.npy"), tstep)
+         self.__metadata["files"].extend([batch[i] for i in order])
+         self.__write_metadata()
@@ -10,7 +10,7 @@ filemanagement.sys.path.insert(0, fullPath)
 # Input folder paths
 filemanagement.sys.path.insert(0, fullPath + "/" + "pyCalculations")
 from reducer import DataReducerVariable
-from rotation import rotateTensorToVector
+from rotation import rotateTensorToVector, rotateTensorsToVectors
 from gyrophaseangle import gyrophase_angles
 import sys
 
@@ -64,17 +64,8 @@ def condition_matrix_array( condition, matrices ):
    # Make sure the matrices is in the correct shape
    if np.ndim(matrices) == np.ndim(condition):
       matrices = np.reshape(matrices, tuple(np.concatenate(([1],[x for x in matrices.shape]))) )
-   # Repeat the condition array n times
-   condition_array = condition*np.reshape(np.ones(np.product(matrices.shape)), matrices.shape)
-   # Get the number of true hits in the condition:
-   num_of_true = 0
-   for i in np.ravel(condition):
-      if i == True:
-         num_of_true = num_of_true + 1
-   # Extract the elements that fill the condition:
-   extracted = np.extract( condition_array, matrices )
-   # Reshape the matrices:
-   extracted = np.reshape(extracted, (len(matrices), num_of_true))
+   # Extract the elements that fill the condition from every matrix:
+   extracted = np.asarray(matrices)[:, np.asarray(condition, dtype=bool)]
    if len(extracted) == 1:
       extracted = extracted[0]
    # Return the extracted elements
@@ -109,10 +100,12 @@ def PTensor( variables ):
       PTensorOffDiagonal = PTensorOffDiagonal.reshape(1,3)[0]
       return np.array([[PTensorDiagonal[0], PTensorOffDiagonal[2], PTensorOffDiagonal[1]],[PTensorOffDiagonal[2], PTensorDiagonal[1], PTensorOffDiagonal[0]],[PTensorOffDiagonal[1], PTensorOffDiagonal[0], PTensorDiagonal[2]]])
    else:
-      result = []
-      for index in np.arange(len(PTensorDiagonal)):
-         result.append(np.array([[PTensorDiagonal[index,0], PTensorOffDiagonal[index,2], PTensorOffDiagonal[index,1]],[PTensorOffDiagonal[index,2], PTensorDiagonal[index,1], PTensorOffDiagonal[index,0]],[PTensorOffDiagonal[index,1], PTensorOffDiagonal[index,0], PTensorDiagonal[index,2]]]))
-      return np.asarray(result)
+      result = np.empty((len(PTensorDiagonal),3,3), dtype=np.result_type(PTensorDiagonal, PTensorOffDiagonal))
+      result[:,[0,1,2],[0,1,2]] = PTensorDiagonal
+      result[:,[1,2],[2,1]] = PTensorOffDiagonal[:,0,None]
+      result[:,[0,2],[2,0]] = PTensorOffDiagonal[:,1,None]
+      result[:,[0,1],[1,0]] = PTensorOffDiagonal[:,2,None]
+      return result
 
 def PTensorRotated( variables ):
    PTensor = variables[0]
@@ -122,10 +115,7 @@ def PTensorRotated( variables ):
       PTensor = PTensor.reshape(3,3)
       return rotateTensorToVector(PTensor, B)
    else:
-      result = []
-      for index in np.arange(len(PTensor)):
-         result.append(rotateTensorToVector(PTensor[index], B[index]))
-      return np.asarray(result)
+      return rotateTensorsToVectors(PTensor, B)
 
 def Pressure( variables ):
    PTensorDiagonal = variables[0]
@@ -139,10 +129,7 @@ def TTensor( variables ):
    if(rho.size == 1):
       return np.divide(PTensor, rho * 1.38065e-23)
    else:
-      result = []
-      for index in np.arange(len(rho)):
-         result.append(np.divide(PTensor[index], (rho[index] + 1.0) * 1.38065e-23))
-      return np.asarray(result)
+      return np.divide(PTensor, ((rho + 1.0) * 1.38065e-23)[:,None,None])
 
 def TTensorRotated( variables):
    TTensor = variables[0]
@@ -152,10 +139,7 @@ def TTensorRotated( variables):
       TTensor = TTensor.reshape(3,3)
       return rotateTensorToVector(TTensor, B)
    else:
-      result = []
-      for index in np.arange(len(TTensor)):
-         result.append(rotateTensorToVector(TTensor[index], B[index]))
-      return np.asarray(result)
+      return rotateTensorsToVectors(TTensor, B)
 
 def Temperature( variables ):
    Pressure = variables[0]
@@ -193,10 +177,7 @@ def TyRotated( variables ):
 def PPerpendicular( variables ):
    PTensor = variables[0]
    PParallel = variables[1]
-   if( np.ndim(PTensorRotated)==2 ):
-      return 0.5*(PTensor.trace() - PParallel)
-   else:
-      return 0.5*(PTensor.transpose().trace() - PParallel)
+   return 0.5*(np.trace(PTensor, axis1=-2, axis2=-1) - PParallel)
 
 def PParallel( variables ):
    PTensor = variables[0]
@@ -206,7 +187,7 @@ def PParallel( variables ):
       return B_normalized.dot(PTensor.dot(B_normalized))
    else:
       B_normalized = np.divide(B, np.sqrt(np.sum(B[:]**2, axis=1))[:,None])
-      return [B_normalized[i].dot(PTensor[i].dot(B_normalized[i])) for i in np.arange(len(PTensor))]
+      return np.einsum('ni,nij,nj->n', B_normalized, PTensor, B_normalized)
 
 def TPerpOverPar( variables ):
    TTensorRotated = variables[0]
@@ -313,7 +294,7 @@ def gyrophase_relstddev( variables, velocity_cell_data, velocity_coordinates ):
    B_unit = B / np.linalg.norm(B)
    
    gyrophase_data = gyrophase_angles(bulk_velocity, B_unit, velocity_cell_data, velocity_coordinates)
-   histo = pl.hist(gyrophase_data[0].data, weights=gyrophase_data[1].data, bins=36, range=[-180.0,180.0], log=False, normed=1)
+   histo = np.histogram(gyrophase_data[0].data, weights=gyrophase_data[1].data, bins=36, range=[-180.0,180.0], density=True)
    return np.std(histo[0])/np.mean(histo[0])
 
 def Dng( variables ):
@@ -331,9 +312,12 @@ def Dng( variables ):
    else:
       B_normalized = np.divide(B, np.sqrt(np.sum(B[:]**2, axis=1))[:,None])
       idMatrix = np.diag(np.ones(3))
-      G = [PPerpendicular[i]*idMatrix + (PParallel[i] - PPerpendicular[i]) * np.outer(B_normalized[i], B_normalized[i]) for i in np.arange(len(PParallel))]
+      PParallel = np.asarray(PParallel)[:,None,None]
+      PPerpendicular = np.asarray(PPerpendicular)[:,None,None]
+      G = PPerpendicular*idMatrix + (PParallel - PPerpendicular) * np.einsum('ni,nj->nij', B_normalized, B_normalized)
       N = PTensor - G
-      return [np.divide(2.0*np.linalg.norm(N[i], 'fro'), PTensor[i].trace()) for i in np.arange(len(PParallel))]
+      # Frobenius norms of the matrices
+      return np.divide(2.0*np.sqrt(np.sum(N**2, axis=(1,2))), np.trace(PTensor, axis1=1, axis2=2))
 
 #datareducers with more complex, case dependent structure.
 datareducers = {}
@@ -376,6 +360,42 @@ datareducers["Bz_linedipole_diff"] =     DataReducerVariable(["B", "Bz_linedipol
 datareducers["gyrophase_relstddev"] =       DataReducerVariable(["v", "B"], gyrophase_relstddev, "", useVspace=True)
 
 
+def get_datareducer_evaluation_order( names, is_stored ):
+   ''' Resolves the dependency graph of the datareducers needed for the given variables
+
+       :param names:        Name or list of names of the requested variables
+       :param is_stored:    Function which returns True if a variable is stored in the file. Stored variables are read as they are even if there is a datareducer with the same name
+       :returns: a list of the requested variables and all of their intermediate and stored input variables, each one only once and after all of its inputs
+
+       .. code-block:: python
+
+          # Example:
+          print get_datareducer_evaluation_order( ["beta", "Temperature"], lambda name: name in ["rho", "B", "PTensorDiagonal"] )
+          # Output:
+          # ['PTensorDiagonal', 'Pressure', 'B', 'beta', 'rho', 'Temperature']
+   '''
+   if isinstance(names, basestring):
+      names = [names]
+   order = []
+   visited = set()
+   in_progress = set()
+   def visit( name ):
+      if name in visited:
+         return
+      if name in in_progress:
+         raise ValueError("Circular datareducer dependency in " + name)
+      in_progress.add(name)
+      if name in datareducers and not datareducers[name].useVspace and not is_stored(name):
+         for variable in datareducers[name].variables:
+            visit(variable)
+      in_progress.remove(name)
+      visited.add(name)
+      order.append(name)
+   for name in names:
+      visit(name)
+   return order
+
+
 #list of operators. The user can apply these to any variable,
 #including more general datareducers. Can only be used to reduce one
 #variable at a time
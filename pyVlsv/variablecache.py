@@ -0,0 +1,116 @@
+''' A least recently used cache for the arrays read and computed by VlsvReader
+
+    .. code-block:: python
+
+       # Example usage:
+       import pytools as pt
+       # Cache for a single reader:
+       cache = pt.vlsvfile.VariableCache(max_bytes=2*1024**3)
+       vlsvReader = pt.vlsvfile.VlsvReader("bulk.0001234.vlsv", variable_cache=cache)
+       # Cache for every reader in the process:
+       pt.vlsvfile.set_global_variable_cache(pt.vlsvfile.VariableCache(max_bytes=2*1024**3))
+
+       beta = vlsvReader.read_variable("beta")
+       # B and the pressure are now taken from the cache:
+       Temperature = vlsvReader.read_variable("Temperature")
+       print cache.get_statistics()
+'''
+
+import numpy as np
+import threading
+from collections import OrderedDict
+
+class VariableCache(object):
+   ''' Least recently used cache of decoded arrays with a byte budget
+
+       The keys are built by VlsvReader from the file, the name, tag and mesh of the array, the operator and the cell selection.
+       Cached arrays are shared between the callers and are therefore made read-only.
+   '''
+   def __init__(self, max_bytes=1024**3):
+      ''' Constructor for the class
+
+          :param max_bytes:       Maximum total size of the cached arrays in bytes
+      '''
+      self.max_bytes = max_bytes
+      self.__arrays = OrderedDict()
+      self.__lock = threading.Lock()
+      self.nbytes = 0
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+
+   def get(self, key):
+      ''' Returns the cached value of the key and marks it as the most recently used, or None if the key is not in the cache
+      '''
+      with self.__lock:
+         if key not in self.__arrays:
+            self.misses = self.misses + 1
+            return None
+         self.hits = self.hits + 1
+         (value, nbytes) = self.__arrays.pop(key)
+         self.__arrays[key] = (value, nbytes)
+         return value
+
+   def put(self, key, value):
+      ''' Adds a value into the cache, evicting the least recently used values until the cache fits into its byte budget
+
+          :param key:             Key of the value
+          :param value:           The value, usually a numpy array
+          :returns: the value, read-only if it is a numpy array that was stored. Values larger than the whole cache are not stored
+      '''
+      nbytes = np.asarray(value).nbytes
+      if nbytes > self.max_bytes:
+         return value
+      if isinstance(value, np.ndarray):
+         value.flags.writeable = False
+      with self.__lock:
+         if key in self.__arrays:
+            self.nbytes = self.nbytes - self.__arrays.pop(key)[1]
+         while self.nbytes + nbytes > self.max_bytes and len(self.__arrays) > 0:
+            (evicted_key, (evicted_value, evicted_nbytes)) = self.__arrays.popitem(last=False)
+            self.nbytes = self.nbytes - evicted_nbytes
+            self.evictions = self.evictions + 1
+         self.__arrays[key] = (value, nbytes)
+         self.nbytes = self.nbytes + nbytes
+      return value
+
+   def clear(self):
+      ''' Removes everything from the cache and resets the statistics
+      '''
+      with self.__lock:
+         self.__arrays = OrderedDict()
+         self.nbytes = 0
+         self.hits = 0
+         self.misses = 0
+         self.evictions = 0
+
+   def get_statistics(self):
+      ''' Returns the cache statistics
+
+          :returns: a dictionary with the number of hits, misses, evictions and cached arrays and the size of the cached arrays in bytes
+      '''
+      with self.__lock:
+         return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self.__arrays), "nbytes": self.nbytes}
+
+   def __len__(self):
+      return len(self.__arrays)
+
+   def __repr__(self):
+      return "VariableCache(" + str(len(self.__arrays)) + " arrays, " + str(self.nbytes) + "/" + str(self.max_bytes) + " bytes, " + str(self.hits) + " hits, " + str(self.misses) + " misses)"
+
+
+# Cache used by the readers which were not given a cache of their own
+global_variable_cache = None
+
+def set_global_variable_cache( cache ):
+   ''' Sets the cache used by every VlsvReader that was not given a cache of its own
+
+       :param cache:           A VariableCache, or None to disable the global cache
+   '''
+   global global_variable_cache
+   global_variable_cache = cache
+
+def get_global_variable_cache():
+   ''' Returns the cache used by every VlsvReader that was not given a cache of its own, None if there is no global cache
+   '''
+   return global_variable_cache
@@ -14,33 +14,99 @@ class VlasiatorReader(VlsvReader):
    ''' Class for reading VLSV files with support for Vlasiator velocity space and structures
 
    '''
+   def __init__( self, *args, **kwargs ):
+      VlsvReader.__init__( self, *args, **kwargs )
+      self.__distribution_cellids = None
+      self.__distribution_tree = None
+
+   def __get_distribution_tree( self ):
+      ''' Returns the cell ids with a velocity distribution and a k-d tree of their coordinates, built on the first call
+
+          :returns: (cell ids, tree) or None if no cell has a velocity distribution
+      '''
+      if self.__distribution_tree is None:
+         from scipy.spatial import cKDTree
+         # Read cell ids with velocity distribution in:
+         cell_candidates = self.read(mesh="SpatialGrid", tag="CELLSWITHBLOCKS")
+         if cell_candidates is None or len(np.atleast_1d(cell_candidates)) == 0:
+            return None
+         self.__distribution_cellids = np.atleast_1d(cell_candidates)
+         self.__distribution_tree = cKDTree(self.get_cell_coordinates(self.__distribution_cellids))
+      return (self.__distribution_cellids, self.__distribution_tree)
+
+   def query_cells_with_distribution( self, coordinates, k=1 ):
+      ''' Finds the cells with a velocity distribution nearest to the given coordinates. The coordinates of the cells with a
+          distribution are indexed in a k-d tree the first time, so the queries take logarithmic time
+
+          :param coordinates:       Coordinates, or an array of shape (N,3) of coordinates
+          :param k:                 Number of nearest cells to find for every point, at most the number of cells with a distribution
+          :returns: [cellids, distances] of the nearest cells, of shape (N,) for N points and (N,k) when k > 1. Equally distant nearest cells resolve to the first one in the file
+
+          .. code-block:: python
+
+             # Example usage:
+             vlasiatorReader = VlasiatorReader("fullf.0001.vlsv")
+             [cellids, distances] = vlasiatorReader.query_cells_with_distribution(np.array([[1e7, 0, 0], [2e7, 0, 0]]), k=4)
+      '''
+      index = self.__get_distribution_tree()
+      if index is None:
+         print "No cells with a velocity distribution in " + self.file_name
+         return
+      (cellids, tree) = index
+      coordinates = np.asarray(coordinates, dtype=float)
+      points = np.atleast_2d(coordinates)
+      if k == 1:
+         candidates = min(16, len(cellids))
+         (distances, indices) = tree.query(points, k=candidates)
+         distances = np.reshape(distances, (len(points), candidates))
+         indices = np.reshape(indices, (len(points), candidates))
+         # Equally distant cells resolve to the first one in the file, as with a linear search
+         tied = (distances == distances[:,:1])
+         nearest = np.where(tied, indices, len(cellids)).min(axis=1)
+         # If all candidates are tied there may be more tied cells, search those points linearly
+         for i in np.nonzero(tied[:,-1] & (candidates < len(cellids)))[0]:
+            nearest[i] = np.argmin(np.sum((tree.data - points[i])**2, axis=-1))
+         distances = distances[:,0]
+         nearest_cellids = cellids[nearest]
+      else:
+         (distances, indices) = tree.query(points, k=min(k, len(cellids)))
+         nearest_cellids = cellids[indices]
+      if coordinates.ndim == 1:
+         return [nearest_cellids[0], distances[0]]
+      return [nearest_cellids, distances]
+
    def get_nearest_cellid_with_distribution( self, cellid ):
+      ''' Returns the cell id of the nearest cell with a velocity distribution
+
+          :param cellid:            The cell's ID, or an array of N cell ids
+          :returns: the cell id, or a numpy array of the N cell ids
+
+          .. seealso:: :func:`query_cells_with_distribution`
+      '''
       # Find the nearest cell id with distribution:
-      # Read cell ids with velocity distribution in:
-      cell_candidates = self.read("SpatialGrid","CELLSWITHBLOCKS")
-      # Read in the coordinates of the cells:
-      cell_candidate_coordinates = [self.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-      # Read in the cell's coordinates:
-      cell_coordinates = self.get_cell_coordinates(cellid)
-      # Find the nearest:
-      norms = np.sum((cell_candidate_coordinates - cell_coordinates)**2, axis=-1)**(1./2)
-      norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-      # Get the cell id:
-      cellid = cell_candidates[i]
-      return cellid
+      result = self.query_cells_with_distribution( self.get_cell_coordinates(cellid) )
+      if result is None:
+         return
+      return result[0]
 
    def get_nearest_coordinates_with_distribution( self, coordinates ):
+      ''' Returns the coordinates of the nearest cell with a velocity distribution
+
+          :param coordinates:       Coordinates, or an array of shape (N,3) of coordinates
+          :returns: the coordinates of the cell, or an array of shape (N,3)
+
+          .. seealso:: :func:`query_cells_with_distribution`
+      '''
       # Find the nearest cell id with distribution:
-      # Read cell ids with velocity distribution in:
-      cell_candidates = self.read("SpatialGrid","CELLSWITHBLOCKS")
-      # Read in the coordinates of the cells:
-      cell_candidate_coordinates = [self.get_cell_coordinates(cell_candidate) for cell_candidate in cell_candidates]
-      # Read in the cell's coordinates:
-      cell_coordinates = coordinates
-      # Find the nearest:
-      norms = np.sum((cell_candidate_coordinates - cell_coordinates)**2, axis=-1)**(1./2)
-      norm, i = min((norm, idx) for (idx, norm) in enumerate(norms))
-      # Get the cell id:
-      cellid = cell_candidates[i]
-      return self.get_cell_coordinates(cellid)
+      result = self.query_cells_with_distribution( coordinates )
+      if result is None:
+         return
+      return self.get_cell_coordinates(result[0])
 
+   def optimize_clear_fileindex_for_cellid_blocks( self ):
+      ''' Clears the private variables containing the velocity block offsets and the spatial index of the cells with a velocity
+          distribution, see :func:`VlsvReader.optimize_clear_fileindex_for_cellid_blocks`
+      '''
+      VlsvReader.optimize_clear_fileindex_for_cellid_blocks( self )
+      self.__distribution_cellids = None
+      self.__distribution_tree = None
@@ -0,0 +1,192 @@
+''' Compressed companion files of vlsv files
+
+    A compressed vlsv file (e.g. bulk.0001234.vlsvz) stores the data of a vlsv file compressed in chunks of a fixed size, so that
+    reading an array or the data of a few cells only decompresses the chunks that contain the requested bytes. VlsvReader opens
+    compressed files transparently.
+
+    File layout:
+
+    .. code-block:: python
+
+       8 bytes        Endianness, as in the vlsv file
+       8 bytes        Offset of the xml footer (uint64)
+       chunks         The bytes of the vlsv file up to its xml footer, compressed separately in chunks of chunksize bytes
+       chunk table    File offsets of the compressed chunks and of the end of the last chunk (uint64)
+       xml footer     The xml footer of the vlsv file, byte for byte. The offsets of the arrays refer to the uncompressed vlsv file. The
+                      first element <COMPRESSION method="zlib" chunksize="1048576" uncompressedsize="..." ...>offset</COMPRESSION>,
+                      inserted right after the opening tag of the footer, describes the compression and gives the file offset of the chunk
+                      table
+
+    .. code-block:: python
+
+       # Example usage:
+       import pytools as pt
+       pt.vlsvfile.compress_file("bulk.0001234.vlsv", method="lzma")
+       vlsvReader = pt.vlsvfile.VlsvReader("bulk.0001234.vlsvz")
+       rho = vlsvReader.read_variable("rho", cellids=[1,2,3])
+'''
+
+import numpy as np
+import xml.etree.ElementTree as ET
+import os
+import re
+import struct
+import zlib
+from collections import OrderedDict
+try:
+   import lzma
+except ImportError:
+   try:
+      from backports import lzma
+   except ImportError:
+      lzma = None
+
+# Compression functions (compress(data, level), decompress(data)) by the name of the method
+compression_methods = {}
+compression_methods["zlib"] = (zlib.compress, zlib.decompress)
+if lzma is not None:
+   compression_methods["lzma"] = (lambda data, level: lzma.compress(data, preset=level), lzma.decompress)
+
+def get_compressed_file_name( file_name ):
+   ''' Returns the default name of the compressed companion of a vlsv file, e.g. bulk.0001234.vlsvz for bulk.0001234.vlsv
+   '''
+   return os.path.splitext(file_name)[0] + ".vlsvz"
+
+def compress_file( file_name, compressed_file_name=None, method="zlib", level=6, chunk_size=1024**2 ):
+   ''' Writes a compressed companion of a vlsv file
+
+       :param file_name:               Name of the vlsv file
+       :param compressed_file_name:    Name of the compressed file, see :func:`get_compressed_file_name` for the default
+       :param method:                  Compression method, "zlib" or "lzma" (lzma needs the lzma or backports.lzma module)
+       :param level:                   Compression level, 0-9
+       :param chunk_size:              Size of the uncompressed chunks in bytes. Smaller chunks make reading a few cells faster but compress worse
+       :returns: the name of the compressed file
+   '''
+   if method not in compression_methods:
+      print "Compression method " + str(method) + " is not available, use one of " + str(compression_methods.keys())
+      return
+   compress = compression_methods[method][0]
+   if compressed_file_name is None:
+      compressed_file_name = get_compressed_file_name(file_name)
+   source = open(file_name, "rb")
+   destination = open(compressed_file_name, "wb")
+   try:
+      endianness = source.read(8)
+      (footer_offset,) = struct.unpack("Q", source.read(8))
+      destination.write(endianness + struct.pack("Q", 0))
+      # Compress everything up to the footer, so that the array offsets stay the same
+      source.seek(0)
+      chunk_offsets = [destination.tell()]
+      position = 0
+      while position < footer_offset:
+         chunk = source.read(min(chunk_size, footer_offset - position))
+         if len(chunk) == 0:
+            raise IOError("Unexpected end of file in " + file_name)
+         destination.write(compress(chunk, level))
+         chunk_offsets.append(destination.tell())
+         position = position + len(chunk)
+      table_offset = destination.tell()
+      np.array(chunk_offsets, dtype=np.uint64).tofile(destination)
+
+      xml_string = source.read()
+      compression = ET.Element("COMPRESSION")
+      compression.attrib["method"] = method
+      compression.attrib["chunksize"] = str(chunk_size)
+      compression.attrib["uncompressedsize"] = str(footer_offset)
+      compression.attrib["arraysize"] = str(len(chunk_offsets))
+      compression.attrib["vectorsize"] = "1"
+      compression.attrib["datatype"] = "uint"
+      compression.attrib["datasize"] = "8"
+      compression.text = str(table_offset)
+      # First in the footer, so that the reader finds it without parsing the rest of the footer. The element is spliced into the
+      # original footer bytes so that decompress_file can cut it out again and restore the footer exactly
+      root_tag = re.search("<[^?!][^>]*>", xml_string)
+      if root_tag is None or root_tag.group(0).endswith("/>"):
+         raise IOError("Bad xml footer in " + file_name)
+      new_footer_offset = destination.tell()
+      destination.write(xml_string[:root_tag.end()] + ET.tostring(compression) + xml_string[root_tag.end():])
+      destination.seek(8)
+      destination.write(struct.pack("Q", new_footer_offset))
+   finally:
+      source.close()
+      destination.close()
+   return compressed_file_name
+
+def decompress_file( compressed_file_name, file_name ):
+   ''' Writes the vlsv file of a compressed vlsv file back. The result is byte for byte the original vlsv file
+
+       :param compressed_file_name:    Name of the compressed file
+       :param file_name:               Name of the vlsv file
+   '''
+   source = open(compressed_file_name, "rb")
+   destination = open(file_name, "wb")
+   try:
+      source.seek(8)
+      (footer_offset,) = struct.unpack("Q", source.read(8))
+      source.seek(footer_offset)
+      xml_string = source.read()
+      compression_tag = re.search("<COMPRESSION[ >].*?</COMPRESSION>", xml_string, re.DOTALL)
+      if compression_tag is None:
+         raise IOError(compressed_file_name + " is not a compressed vlsv file")
+      compression = ET.fromstring(compression_tag.group(0))
+      source.seek(int(compression.text))
+      chunk_offsets = np.fromfile(source, dtype=np.uint64, count=int(compression.attrib["arraysize"]))
+      decompress = compression_methods[compression.attrib["method"]][1]
+      # The chunks contain the original header, including the offset of the footer
+      for i in xrange(len(chunk_offsets) - 1):
+         source.seek(chunk_offsets[i])
+         destination.write(decompress(source.read(chunk_offsets[i+1] - chunk_offsets[i])))
+      # Cut the compression element out of the footer, leaving the original footer bytes
+      destination.write(xml_string[:compression_tag.start()] + xml_string[compression_tag.end():])
+   finally:
+      source.close()
+      destination.close()
+
+class CompressedChunks(object):
+   ''' Reads byte ranges of the uncompressed data of a compressed vlsv file, decompressing only the chunks that the ranges touch.
+       The last decompressed chunks are kept in memory
+   '''
+   def __init__(self, method, chunk_size, chunk_offsets, cache_size=8):
+      ''' :param method:         Name of the compression method
+          :param chunk_size:     Size of the uncompressed chunks in bytes
+          :param chunk_offsets:  File offsets of the compressed chunks and of the end of the last chunk
+          :param cache_size:     Number of decompressed chunks kept in memory
+      '''
+      if method not in compression_methods:
+         raise IOError("Compression method " + str(method) + " is not available")
+      self.__decompress = compression_methods[method][1]
+      self.__chunk_size = chunk_size
+      self.__chunk_offsets = np.asarray(chunk_offsets, dtype=np.int64)
+      self.__cache_size = cache_size
+      self.__chunks = OrderedDict()
+
+   def __get_chunk(self, fptr, index):
+      if index in self.__chunks:
+         # Mark as the most recently used
+         chunk = self.__chunks.pop(index)
+      else:
+         fptr.seek(self.__chunk_offsets[index])
+         chunk = self.__decompress(fptr.read(self.__chunk_offsets[index+1] - self.__chunk_offsets[index]))
+      self.__chunks[index] = chunk
+      while len(self.__chunks) > self.__cache_size:
+         self.__chunks.popitem(last=False)
+      return chunk
+
+   def read(self, fptr, offset, count):
+      ''' Reads count bytes from the given offset of the uncompressed data
+
+          :param fptr:           The compressed file, open for reading
+          :param offset:         Offset in the uncompressed data
+          :param count:          Number of bytes to read
+          :returns: a string of the bytes
+      '''
+      if count <= 0:
+         return ""
+      first = offset // self.__chunk_size
+      last = (offset + count - 1) // self.__chunk_size
+      if first == last:
+         data = self.__get_chunk(fptr, first)
+      else:
+         data = "".join([self.__get_chunk(fptr, i) for i in xrange(first, last + 1)])
+      start = offset - first * self.__chunk_size
+      return data[start:start + count]
@@ -0,0 +1,86 @@
+''' Extraction of a region of interest and a subset of the variables of a vlsv file into a new, smaller vlsv file
+
+    The new file has the same spatial mesh geometry and parameters as the original file, but only the selected cells: the MESH,
+    MESH_DOMAIN_SIZES and CellID arrays list the selected cells and every variable is written in the same cell order. The velocity
+    blocks of the selected cells can be included, so the new file can be opened with the same VlsvReader API as the original one.
+
+    .. code-block:: python
+
+       # Example usage:
+       import pytools as pt
+       vlsvReader = pt.vlsvfile.VlsvReader("bulk.0001000.vlsv")
+       # rho and B of the cells in a box around the bow shock, with their velocity distributions:
+       pt.vlsvfile.extract_region(vlsvReader, "bowshock.0001000.vlsv", ["rho", "B"], bounding_box=[6e7, -3e7, -1e6, 9e7, 3e7, 1e6], velocity_space=True)
+       subset = pt.vlsvfile.VlsvReader("bowshock.0001000.vlsv")
+'''
+
+import numpy as np
+from vlsvwriter import VlsvWriter
+
+def extract_region( vlsvReader, file_name, variables=None, cellids=None, bounding_box=None, velocity_space=False ):
+   ''' Writes the given variables of a subset of the cells of a vlsv file into a new vlsv file
+
+       :param vlsvReader:      Some VlsvReader class with a file open
+       :param file_name:       Name of the new vlsv file
+       :param variables:       List of the names of the variables, all stored variables by default. Datareducers are evaluated and written as variables, tensors as 9 component vectors
+       :param cellids:         List of cell ids to extract
+       :param bounding_box:    If no cell ids are given, the cells whose centers are inside [xmin, ymin, zmin, xmax, ymax, zmax] are extracted
+       :param velocity_space:  If True the velocity blocks of the extracted cells are written as well
+       :returns: the sorted cell ids of the extracted cells, or None if there are no cells to extract
+   '''
+   if cellids is None:
+      if bounding_box is None:
+         print "Give either cellids or bounding_box at extract_region"
+         return
+      cellids = vlsvReader.get_cellids_in_box(bounding_box)
+   all_cellids = vlsvReader.read_variable("CellID")
+   cellids = np.unique(np.atleast_1d(cellids).astype(all_cellids.dtype))
+   missing = np.setdiff1d(cellids, all_cellids)
+   if len(missing) > 0:
+      print "Note: " + str(len(missing)) + " cell ids are not in " + vlsvReader.file_name + ", skipping them"
+      cellids = np.intersect1d(cellids, all_cellids)
+   if len(cellids) == 0:
+      print "No cells to extract from " + vlsvReader.file_name
+      return
+   if variables is None:
+      variables = vlsvReader.get_all_variables()
+   variables = [name for name in variables if name != "CellID"]
+   xml_root = vlsvReader.get_xml_root()
+
+   with VlsvWriter(vlsvReader, file_name, deferred_footer=True, copy_cellids=False) as vlsvWriter:
+      # The spatial mesh with the extracted cells as a single domain
+      for child in xml_root:
+         if child.tag == "MESH" and child.attrib.get("name") == "SpatialGrid":
+            extra_attribs = {}
+            for i in child.attrib.iteritems():
+               if i[0] not in ["name", "mesh", "arraysize", "vectorsize", "datatype", "datasize"]:
+                  extra_attribs[i[0]] = i[1]
+            vlsvWriter.write( data=cellids, name="SpatialGrid", tag="MESH", mesh="", extra_attribs=extra_attribs )
+      vlsvWriter.write( data=np.array([[len(cellids), 0]], dtype=np.uint64), name="", tag="MESH_DOMAIN_SIZES", mesh="SpatialGrid" )
+      vlsvWriter.write( data=cellids, name="CellID", tag="VARIABLE", mesh="SpatialGrid" )
+
+      # The variables in the order of the cell ids
+      values = vlsvReader.read_variables(variables, cellids)
+      for j in xrange(len(variables)):
+         data = np.asarray(values[j])
+         if len(cellids) == 1 or data.ndim > 2:
+            data = np.reshape(data, (len(cellids), -1))
+         if data.ndim == 2 and data.shape[1] == 1:
+            data = data[:,0]
+         vlsvWriter.write( data=data, name=variables[j], tag="VARIABLE", mesh="SpatialGrid" )
+
+      if velocity_space:
+         cellswithblocks = np.atleast_1d(vlsvReader.read(mesh="SpatialGrid", tag="CELLSWITHBLOCKS"))
+         cellswithblocks = cellids[np.in1d(cellids, cellswithblocks)]
+      if velocity_space and len(cellswithblocks) > 0:
+         [block_ids, avgs, offsets] = vlsvReader.read_blocks_many(cellswithblocks)
+         block_variable = "avgs"
+         for child in xml_root:
+            if child.tag == "BLOCKVARIABLE":
+               block_variable = child.attrib["name"]
+               break
+         vlsvWriter.write( data=cellswithblocks, name="", tag="CELLSWITHBLOCKS", mesh="SpatialGrid" )
+         vlsvWriter.write( data=np.diff(offsets).astype(np.uint32), name="", tag="BLOCKSPERCELL", mesh="SpatialGrid" )
+         vlsvWriter.write( data=block_ids, name="", tag="BLOCKIDS", mesh="SpatialGrid" )
+         vlsvWriter.write( data=avgs, name=block_variable, tag="BLOCKVARIABLE", mesh="SpatialGrid" )
+   return cellids
@@ -13,3 +13,8 @@
 from vlsvreader import VlsvReader
 from vlsvwriter import VlsvWriter
 from vlasiatorreader import VlasiatorReader
+from variablecache import VariableCache, set_global_variable_cache, get_global_variable_cache
+from vlsvprefetch import prefetch_files
+from cubestore import CubeStore, create_cube_store
+from vlsvextract import extract_region
+from vlsvcompression import compress_file, decompress_file
@@ -0,0 +1,140 @@
+''' Functions for reading and writing VLSV index files
+
+    An index file (e.g. bulk.0001234.vlsv.idx) is a sidecar of a vlsv file which stores the xml footer of the vlsv file along with
+    the cell id and velocity block index arrays of the VlsvReader, so that re-opening the same file does not need to read the
+    footer or rebuild the indices. The index file is only used if the size and the modification time of the vlsv file match the
+    ones stored in the index file.
+
+    File layout:
+
+    .. code-block:: python
+
+       8 bytes        Magic string "VLSVIDX1"
+       8 bytes        Length of the header in bytes (uint64)
+       header         Python literal of a dictionary with the vlsv file size and modification time, the location of the xml footer
+                      and the data type, shape and location of every array
+       xml footer     The xml footer of the vlsv file
+       arrays         Raw arrays, each one starting at an offset that is a multiple of 8 bytes
+
+    The footer is stored as the xml string rather than as parsed entries: the VlsvReader indexes the footer lazily while parsing it,
+    so storing the xml keeps a single code path for vlsv and index files. Reading the index file still skips reading the footer
+    from the vlsv file and rebuilding the cell indices.
+
+    Index files are written into a temporary file which is then renamed over the index file, so that an interrupted write or a
+    concurrent reader never sees a partially written index file.
+'''
+
+import numpy as np
+import ast
+import os
+import struct
+import tempfile
+
+index_file_magic = "VLSVIDX1"
+index_file_version = 1
+
+def get_index_file_name( file_name ):
+   ''' Returns the name of the index file of a vlsv file
+
+       :param file_name:       Name of the vlsv file
+       :returns: name of the index file
+   '''
+   return file_name + ".idx"
+
+def _get_umask():
+   ''' Returns the file mode creation mask of the process
+   '''
+   umask = os.umask(0)
+   os.umask(umask)
+   return umask
+
+def write_index_file( index_file_name, file_name, xml_string, arrays ):
+   ''' Writes an index file for a vlsv file
+
+       :param index_file_name: Name of the index file to write
+       :param file_name:       Name of the vlsv file the index belongs to
+       :param xml_string:      The xml footer of the vlsv file
+       :param arrays:          Dictionary of the index arrays by name
+   '''
+   stat = os.stat(file_name)
+   header = {}
+   header["version"] = index_file_version
+   header["size"] = stat.st_size
+   header["mtime"] = stat.st_mtime
+   header["xml_size"] = len(xml_string)
+   header["arrays"] = {}
+   # The header length depends on the array offsets, so fix the offsets with the header written as if the data starts from 0
+   # and shift the data by the length of the header afterwards
+   offset = 0
+   for name in sorted(arrays.keys()):
+      array = np.ascontiguousarray(arrays[name])
+      header["arrays"][name] = [array.dtype.str, list(array.shape), offset]
+      offset = offset + ((array.nbytes + 7) // 8) * 8
+   while True:
+      header_string = repr(header)
+      data_offset = 16 + len(header_string) + len(xml_string)
+      data_offset = ((data_offset + 7) // 8) * 8
+      if header.get("data_offset") == data_offset:
+         break
+      header["data_offset"] = data_offset
+   (fd, temporary_file_name) = tempfile.mkstemp(prefix=os.path.basename(index_file_name) + ".", dir=os.path.dirname(os.path.abspath(index_file_name)))
+   try:
+      fptr = os.fdopen(fd, "wb")
+      try:
+         fptr.write(index_file_magic)
+         fptr.write(struct.pack("Q", len(header_string)))
+         fptr.write(header_string)
+         fptr.write(xml_string)
+         for name in sorted(arrays.keys()):
+            (dtype, shape, offset) = header["arrays"][name]
+            fptr.seek(data_offset + offset)
+            np.ascontiguousarray(arrays[name]).tofile(fptr)
+      finally:
+         fptr.close()
+      # mkstemp creates the file readable by the owner only
+      os.chmod(temporary_file_name, 0666 & ~_get_umask())
+      os.rename(temporary_file_name, index_file_name)
+   except:
+      os.remove(temporary_file_name)
+      raise
+
+def read_index_file( index_file_name, file_name ):
+   ''' Reads an index file of a vlsv file
+
+       :param index_file_name: Name of the index file
+       :param file_name:       Name of the vlsv file the index belongs to
+       :returns: the xml footer string and a dictionary of read-only memory mapped index arrays, or None if the index file does not exist, does not match the vlsv file or is truncated
+   '''
+   if not os.path.isfile(index_file_name):
+      return None
+   stat = os.stat(file_name)
+   fptr = open(index_file_name, "rb")
+   try:
+      index_file_size = os.fstat(fptr.fileno()).st_size
+      if fptr.read(len(index_file_magic)) != index_file_magic:
+         return None
+      (header_size,) = struct.unpack("Q", fptr.read(8))
+      header = ast.literal_eval(fptr.read(header_size))
+      if header["version"] != index_file_version or header["size"] != stat.st_size or header["mtime"] != stat.st_mtime:
+         # Stale index file
+         return None
+      xml_string = fptr.read(header["xml_size"])
+      if len(xml_string) != header["xml_size"]:
+         raise ValueError("Truncated xml footer")
+      for name in header["arrays"]:
+         (dtype, shape, offset) = header["arrays"][name]
+         if header["data_offset"] + offset + np.dtype(dtype).itemsize * int(np.prod(shape)) > index_file_size:
+            raise ValueError("Truncated array " + name)
+   except (ValueError, SyntaxError, KeyError, TypeError, struct.error):
+      print "Bad index file " + index_file_name
+      return None
+   finally:
+      fptr.close()
+   arrays = {}
+   for name in header["arrays"]:
+      (dtype, shape, offset) = header["arrays"][name]
+      if np.prod(shape) == 0:
+         arrays[name] = np.zeros(shape, dtype=dtype)
+      else:
+         arrays[name] = np.memmap(index_file_name, dtype=dtype, mode="r", offset=header["data_offset"] + offset, shape=tuple(shape))
+   return (xml_string, arrays)
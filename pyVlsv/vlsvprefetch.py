@@ -0,0 +1,71 @@
+''' Read-ahead iteration over a series of vlsv files
+
+    While the data of one file is being processed, the next files are opened and their variables are read on a pool of threads,
+    so that the file reads overlap with the computation.
+
+    .. code-block:: python
+
+       # Example usage:
+       import pytools as pt
+       file_names = pt.miscellaneous.get_sorted_file_names("bulk.*.vlsv")
+       for (vlsvReader, data) in pt.vlsvfile.prefetch_files(file_names, ["rho", "B"], prefetch=4):
+          print vlsvReader.read_parameter("t"), np.max(data["rho"]), np.mean(data["B"], axis=0)
+'''
+
+import numpy as np
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from vlsvreader import VlsvReader
+
+def _read_file( file_name, variables, cellids, operator, reader_arguments ):
+   ''' Opens a file and reads the given variables from it
+
+       :returns: the reader, a dictionary of the variables by name and the size of the variables in bytes
+   '''
+   vlsvReader = VlsvReader(file_name, **reader_arguments)
+   vlsvReader.optimize_open_file()
+   try:
+      values = vlsvReader.read_variables(variables, cellids, operator)
+   finally:
+      vlsvReader.optimize_close_file()
+   data = dict(zip(variables, values))
+   nbytes = sum(np.asarray(value).nbytes for value in values)
+   return (vlsvReader, data, nbytes)
+
+def prefetch_files( file_names, variables, cellids=-1, operator="pass", prefetch=2, max_bytes=2*1024**3, **reader_arguments ):
+   ''' Iterates over vlsv files, reading the given variables of the next files in background threads
+
+       :param file_names:         List of the file names, in the order of iteration
+       :param variables:          List of the names of the variables to read from every file
+       :param cellids:            a value of -1 reads all data, a list of cell ids reads the data of the given cells
+       :param operator:           Datareduction operator applied to every variable
+       :param prefetch:           Maximum number of files read ahead of the file being processed
+       :param max_bytes:          Approximate limit for the size of the variables read ahead, in bytes. At least one file is always read ahead
+       :param reader_arguments:   Additional arguments for the VlsvReader of each file, e.g. use_mmap=True
+       :returns: a generator of (vlsvReader, data) pairs in the order of file_names, where data is a dictionary of the variables by name
+
+       .. seealso:: :func:`VlsvReader.read_variables`
+   '''
+   variables = list(variables)
+   pool = ThreadPool(max(1, prefetch))
+   # Files being read, in the order of iteration
+   pending = deque()
+   # Size of the variables of the latest file, used for estimating the size of the files still being read
+   file_size = 0
+   next_index = 0
+   try:
+      while next_index < len(file_names) or len(pending) > 0:
+         while next_index < len(file_names) and len(pending) < max(1, prefetch):
+            # Failed reads are left for the iteration to raise when their file is reached
+            ready_bytes = sum(result.get()[2] for result in pending if result.ready() and result.successful())
+            in_flight = sum(1 for result in pending if not result.ready())
+            if len(pending) > 0 and ready_bytes + (in_flight + 1) * file_size > max_bytes:
+               break
+            pending.append(pool.apply_async(_read_file, (file_names[next_index], variables, cellids, operator, reader_arguments)))
+            next_index = next_index + 1
+         (vlsvReader, data, nbytes) = pending.popleft().get()
+         file_size = nbytes
+         yield (vlsvReader, data)
+   finally:
+      pool.terminate()
+      pool.join()
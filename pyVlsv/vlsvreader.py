@@ -1,31 +1,82 @@
 import struct
 import xml.etree.ElementTree as ET
-import ast
 import numpy as np
 import os
-from reduction import datareducers,data_operators
-from collections import Iterable
+from cStringIO import StringIO
+from reduction import datareducers,data_operators,get_datareducer_evaluation_order
+from collections import Iterable, OrderedDict
 from vlsvwriter import VlsvWriter
 from variable import get_data
+import vlsvindex
+import variablecache
+import vspaceengine
+import vlsvcompression
+
+# Numpy data types for the (datatype, datasize) attribute pairs of the xml footer
+vlsv_datatypes = {}
+vlsv_datatypes[("float", 4)] = np.float32
+vlsv_datatypes[("float", 8)] = np.float64
+vlsv_datatypes[("int", 4)] = np.int32
+vlsv_datatypes[("int", 8)] = np.int64
+vlsv_datatypes[("uint", 4)] = np.uint32
+vlsv_datatypes[("uint", 8)] = np.uint64
+
+# Coordinates of the velocity cell centers relative to their block, shape (64,3), by the velocity cell size (dvx, dvy, dvz)
+velocity_cell_offset_tables = {}
 
 class VlsvReader(object):
    ''' Class for reading VLSV files
    ''' 
    file_name=""
-   def __init__(self, file_name):
+   def __init__(self, file_name, use_mmap=False, use_index_file=False, variable_cache=None):
       ''' Initializes the vlsv file (opens the file, reads the file footer and reads in some parameters)
 
           :param file_name:     Name of the vlsv file
+          :param use_mmap:      If True the file is memory mapped and the arrays returned by :func:`read` and :func:`read_variable` are read-only views of the mapped file instead of copies
+          :param use_index_file: If True the footer and the cell indices are loaded from the index file next to the vlsv file (file_name + ".idx"). If the index file does not exist or is out of date, it is written, see :func:`write_index_file`
+          :param variable_cache: A :class:`variablecache.VariableCache` for the arrays returned by :func:`read`, including the variables read by the datareducers. If None the global cache is used if one has been set with :func:`variablecache.set_global_variable_cache`
+
+          .. code-block:: python
+
+             # Example usage:
+             vlsvReader = VlsvReader("bulk.0001234.vlsv", use_mmap=True)
+             # Only the pages touched by the slice are read from the disk:
+             rho = vlsvReader.read_variable("rho")[1000:2000]
+
+          .. note:: In memory mapped mode the returned arrays can not be modified in place, copy them with np.array(data) first
       '''
       # Make sure the path is set in file name: 
       file_name = os.path.abspath(file_name)
 
       self.file_name = file_name
+      self.__use_mmap = use_mmap
+      self.__variable_cache = variable_cache
+      self.__mmap = None
       self.__fptr = open(self.file_name,"rb")
-      self.__xml_root = ET.fromstring("<VLSV></VLSV>")
-      self.__fileindex_for_cellid={}
-      self.__fileindex_for_cellid_blocks={}
-      self.__read_xml_footer()
+      stat = os.fstat(self.__fptr.fileno())
+      self.__file_signature = (self.file_name, stat.st_size, stat.st_mtime)
+      self.__xml_root = None
+      self.__footer_parser = None
+      self.__footer_index = {}
+      self.__footer_wildcards = {}
+      self.__footer_entries = {}
+      self.__fileindex_for_cellid=np.zeros(0, dtype=np.int64)
+      self.__sorted_cellids=None
+      self.__blocks_cellids=np.zeros(0, dtype=np.int64)
+      self.__blocks_offsets=np.zeros(0, dtype=np.int64)
+      self.__blocks_counts=np.zeros(0, dtype=np.int64)
+      self.__velocity_distributions = OrderedDict()
+      self.__velocity_distribution_cache_size = 8
+      self.__grid_fileindices = None
+      self.__compressed_chunks = None
+      index_file = None
+      if use_index_file:
+         index_file = vlsvindex.read_index_file(vlsvindex.get_index_file_name(self.file_name), self.file_name)
+      if index_file is None:
+         self.__read_xml_footer()
+      else:
+         self.__load_index_file(index_file)
+      self.__set_compressed_chunks()
       # Check if the file is using new or old vlsv format
       # Read parameters (Note: Reading the spatial cell locations and
       # storing them will anyway take the most time and memory):
@@ -139,13 +190,20 @@ class VlsvReader(object):
          self.__dvy = ((self.__vymax - self.__vymin) / (float)(self.__vyblocks)) / (float)(self.__vyblock_size)
          self.__dvz = ((self.__vzmax - self.__vzmin) / (float)(self.__vzblocks)) / (float)(self.__vzblock_size)
 
+      if use_index_file and index_file is None:
+         try:
+            self.write_index_file()
+         except (IOError, OSError):
+            print "Note: Could not write the index file of " + self.file_name
+
       self.__fptr.close()
 
 
    def __read_xml_footer(self):
       ''' Reads in the XML footer of the VLSV file and store all the content
+
+          The footer is read from its offset to the end of the file. It is parsed lazily, see :func:`__set_xml_footer`
       ''' 
-      max_xml_size = 1000000
       #(endianness,) = struct.unpack("c", fptr.read(1))
       if self.__fptr.closed:
          fptr = open(self.file_name,"rb")
@@ -159,26 +217,207 @@ class VlsvReader(object):
       (offset,) = struct.unpack("Q", fptr.read(uint64_byte_amount))
       # Move to the xml offset
       fptr.seek(offset)
-      # Read the xml data
-      xml_data = fptr.read(max_xml_size)
-      # Read the xml as string
-      (xml_string,) = struct.unpack("%ds" % len(xml_data), xml_data)
-      # Input the xml data into xml_root
-      self.__xml_root = ET.fromstring(xml_string)
+      # Read the xml data, the footer extends to the end of the file
+      xml_string = fptr.read(os.fstat(fptr.fileno()).st_size - offset)
       if self.__fptr.closed:
          fptr.close()
+      self.__set_xml_footer(xml_string)
+
+   def __set_xml_footer(self, xml_string):
+      ''' Starts an incremental parse of the given xml footer
+
+          The array descriptions are indexed only as far as the arrays asked for are found, see :func:`__get_footer_entry`. The
+          whole xml tree is only built when needed, see :func:`__get_xml_root`.
+
+          :param xml_string:      The xml footer
+      '''
+      self.__xml_root = None
+      self.__footer_parser = ET.iterparse(StringIO(xml_string), events=("start", "end"))
+      self.__footer_depth = 0
+      self.__footer_position = 0
+      self.__footer_index = {}
+      self.__footer_wildcards = {}
+      self.__footer_entries = {}
+
+   def __get_xml_root(self):
+      ''' Returns the root of the xml footer, parsing the rest of the footer if it has not been parsed yet
+      '''
+      while self.__parse_xml_footer():
+         pass
+      return self.__xml_root
+
+   def get_xml_root(self):
+      ''' Returns the root element of the xml footer of the file. The elements describe the arrays of the file and must not be modified
+
+          .. code-block:: python
+
+             # Example usage:
+             for child in vlsvReader.get_xml_root():
+                print child.tag, child.attrib
+      '''
+      return self.__get_xml_root()
+
+   def __set_compressed_chunks(self):
+      ''' Reads the chunk table of a compressed vlsv file, see :mod:`vlsvcompression`. The arrays of a compressed file are read
+          through the chunk table, decompressing only the chunks that are needed
+      '''
+      # The compression element is always the first one in the footer, so only the first footer element is parsed here and the
+      # footer of an uncompressed file stays unparsed
+      if self.__footer_position == 0:
+         self.__parse_xml_footer()
+      if self.__xml_root is None or len(self.__xml_root) == 0 or self.__xml_root[0].tag != "COMPRESSION":
+         return
+      entry = self.__footer_index.get(("COMPRESSION", "", ""))
+      if entry is None:
+         return
+      compression = self.__xml_root[0]
+      (position, datatype, array_size, vector_size, offset) = entry
+      chunk_offsets = self.__read_array(self.__fptr, offset, datatype, array_size)
+      self.__compressed_chunks = vlsvcompression.CompressedChunks(compression.attrib["method"], int(compression.attrib["chunksize"]), chunk_offsets)
+      # The compressed data can not be memory mapped
+      self.__use_mmap = False
+
+   def is_compressed(self):
+      ''' Returns True if the file is a compressed vlsv file, see :mod:`vlsvcompression`
+      '''
+      return self.__compressed_chunks is not None
+
+   def __load_index_file(self, index_file):
+      ''' Takes the xml footer and the cell indices from the contents of an index file
+
+          :param index_file:      The xml footer string and the index arrays, see :func:`vlsvindex.read_index_file`
+      '''
+      (xml_string, arrays) = index_file
+      self.__set_xml_footer(xml_string)
+      if "fileindex_for_cellid" in arrays:
+         self.__fileindex_for_cellid = arrays["fileindex_for_cellid"]
+         self.__sorted_cellids = arrays.get("sorted_cellids")
+      if "blocks_cellids" in arrays:
+         self.__blocks_cellids = arrays["blocks_cellids"]
+         self.__blocks_offsets = arrays["blocks_offsets"]
+         self.__blocks_counts = arrays["blocks_counts"]
+
+   def write_index_file(self):
+      ''' Writes the xml footer and the cell id and velocity block indices into an index file next to the vlsv file (file_name + ".idx")
+
+          Readers opened with use_index_file=True load these from the index file instead of building them again. The index file is
+          ignored once the size or the modification time of the vlsv file changes.
+
+          .. code-block:: python
+
+             # Example usage:
+             vlsvReader = VlsvReader("bulk.0001234.vlsv")
+             vlsvReader.write_index_file()
+             # Opening the file again is now fast:
+             vlsvReader = VlsvReader("bulk.0001234.vlsv", use_index_file=True)
+
+          .. seealso:: :mod:`vlsvindex`
+      '''
+      arrays = {}
+      if self.__get_footer_entry("CellID", "VARIABLE", "SpatialGrid") is not None:
+         if len( self.__fileindex_for_cellid ) == 0:
+            self.__read_fileindex_for_cellid()
+         arrays["fileindex_for_cellid"] = self.__fileindex_for_cellid
+         if self.__sorted_cellids is not None:
+            arrays["sorted_cellids"] = self.__sorted_cellids
+      if self.__get_footer_entry("", "CELLSWITHBLOCKS", "SpatialGrid") is not None:
+         self.__set_cell_offset_and_blocks()
+         arrays["blocks_cellids"] = self.__blocks_cellids
+         arrays["blocks_offsets"] = self.__blocks_offsets
+         arrays["blocks_counts"] = self.__blocks_counts
+      vlsvindex.write_index_file(vlsvindex.get_index_file_name(self.file_name), self.file_name, ET.tostring(self.__get_xml_root()), arrays)
+
+   def __parse_xml_footer(self):
+      ''' Parses the xml footer up to the next array description and adds it into the footer index
+
+          The index is keyed by (tag, name, mesh). Every entry is also stored under the keys with an empty name and/or mesh so that
+          reads which leave out the name or the mesh hit the index directly. Arrays without a name or mesh attribute match any
+          requested name or mesh, so they are additionally listed per tag.
+
+          :returns: False if the whole footer has been parsed already, True otherwise
+      '''
+      if self.__footer_parser is None:
+         return False
+      for (event, child) in self.__footer_parser:
+         if event == "start":
+            if self.__xml_root is None:
+               self.__xml_root = child
+            self.__footer_depth = self.__footer_depth + 1
+            continue
+         self.__footer_depth = self.__footer_depth - 1
+         if self.__footer_depth != 1:
+            continue
+         position = self.__footer_position
+         self.__footer_position = position + 1
+         if "name" in child.attrib: name = child.attrib["name"]
+         else: name = None
+         if "mesh" in child.attrib: mesh = child.attrib["mesh"]
+         else: mesh = None
+         try:
+            datatype = child.attrib["datatype"]
+            element_size = int(child.attrib["datasize"])
+            entry = (position,
+                     vlsv_datatypes.get((datatype, element_size)),
+                     int(child.attrib["arraysize"]),
+                     int(child.attrib["vectorsize"]),
+                     int(child.text))
+         except (KeyError, TypeError, ValueError):
+            # Not an array description
+            continue
+         self.__footer_entries.setdefault(child.tag, []).append((name, mesh, entry))
+         if name is None or mesh is None:
+            self.__footer_wildcards.setdefault(child.tag, []).append((name, mesh, entry))
+         for key_name in set([name or "", ""]):
+            for key_mesh in set([mesh or "", ""]):
+               self.__footer_index.setdefault((child.tag, key_name, key_mesh), entry)
+         return True
+      # The whole footer has been parsed
+      self.__footer_parser = None
+      return False
+
+   def __get_footer_entry(self, name, tag, mesh):
+      ''' Returns the footer entry (position, dtype, array size, vector size, offset) of the first array matching name, tag and mesh
+
+          :param name: Name of the data array, "" matches any name
+          :param tag:  Tag of the data array
+          :param mesh: Mesh of the data array, "" matches any mesh
+          :returns: the footer entry or None if no array matches
+      '''
+      while True:
+         entry = self.__footer_index.get((tag, name, mesh))
+         # An earlier array without a name or mesh attribute matches as well
+         for (entry_name, entry_mesh, wildcard) in self.__footer_wildcards.get(tag, []):
+            if entry is not None and wildcard[0] >= entry[0]:
+               break
+            if name != "" and entry_name is not None and entry_name != name:
+               continue
+            if mesh != "" and entry_mesh is not None and entry_mesh != mesh:
+               continue
+            entry = wildcard
+            break
+         # The arrays are indexed in file order, so the first match is final
+         if entry is not None or not self.__parse_xml_footer():
+            return entry
 
    def __read_fileindex_for_cellid(self):
-      """ Read in the cell ids and create an internal dictionary to give the index of an arbitrary cellID
-      """
-      cellids=self.read(mesh="SpatialGrid",name="CellID", tag="VARIABLE")
+      """ Read in the cell ids and create an internal index array to give the index of an arbitrary cellID
 
-      #Check if it is not iterable. If it is a scale then make it a list
-      if(not isinstance(cellids, Iterable)):
-         cellids=[ cellids ]
-      for index,cellid in enumerate(cellids):
-         self.__fileindex_for_cellid[cellid]=index
-         
+          If the cell ids are dense (e.g. a full grid) the index is the inverse permutation, i.e. the file index of every cell id
+          up to the largest one. Otherwise the sorting permutation of the cell ids is stored along with the sorted cell ids, which
+          are searched with np.searchsorted.
+      """
+      cellids=np.atleast_1d(self.read(mesh="SpatialGrid",name="CellID", tag="VARIABLE")).astype(np.int64)
+      if len(cellids) == 0:
+         return
+      if cellids.min() >= 0 and cellids.max() < 2*len(cellids) + 1024:
+         fileindex_for_cellid = np.empty(cellids.max() + 1, dtype=np.int64)
+         fileindex_for_cellid.fill(-1)
+         fileindex_for_cellid[cellids] = np.arange(len(cellids))
+         self.__sorted_cellids = None
+      else:
+         fileindex_for_cellid = np.argsort(cellids, kind="mergesort")
+         self.__sorted_cellids = cellids[fileindex_for_cellid]
+      self.__fileindex_for_cellid = fileindex_for_cellid
 
    def __read_blocks(self, cellid):
       ''' Read raw block data from the open file.
@@ -186,61 +425,28 @@ class VlsvReader(object):
       :param cellid: Cell ID of the cell whose velocity blocks are read
       :returns: A numpy array with block ids and their data
       '''
-      if( len(self.__fileindex_for_cellid_blocks) == 0 ):
-         self.__set_cell_offset_and_blocks()
-
-      if( (cellid in self.__fileindex_for_cellid_blocks) == False ):
+      cell_blocks = self.__get_cell_blocks(cellid)
+      if cell_blocks is None:
          # Cell id has no blocks
          return []
-      offset = self.__fileindex_for_cellid_blocks[cellid][0]
-      num_of_blocks = self.__fileindex_for_cellid_blocks[cellid][1]
+      (offset, num_of_blocks) = cell_blocks
 
-      if self.__fptr.closed:
+      if self.__fptr.closed and not self.__use_mmap:
          fptr = open(self.file_name,"rb")
       else:
          fptr = self.__fptr
 
-      # Read in avgs and velocity cell ids:
-      for child in self.__xml_root:
-         # Read in avgs
-         if ("name" in child.attrib) and (child.attrib["name"] == "avgs" or child.attrib["name"] == "proton") and (child.tag == "BLOCKVARIABLE"):
-            vector_size = ast.literal_eval(child.attrib["vectorsize"])
-            #array_size = ast.literal_eval(child.attrib["arraysize"])
-            element_size = ast.literal_eval(child.attrib["datasize"])
-            datatype = child.attrib["datatype"]
-
-            # Navigate to the correct position
-            offset_avgs = offset * vector_size * element_size + ast.literal_eval(child.text)
-#            for i in range(0, cells_with_blocks_index[0]):
-#               offset_avgs += blocks_per_cell[i]*vector_size*element_size
-
-            fptr.seek(offset_avgs)
-            if datatype == "float" and element_size == 4:
-               data_avgs = np.fromfile(fptr, dtype = np.float32, count = vector_size*num_of_blocks)
-            if datatype == "float" and element_size == 8:
-               data_avgs = np.fromfile(fptr, dtype = np.float64, count = vector_size*num_of_blocks)
-            data_avgs = data_avgs.reshape(num_of_blocks, vector_size)
-
-         # Read in block coordinates:
-         if "mesh" in child.attrib and child.attrib["mesh"] == "SpatialGrid" and child.tag == "BLOCKIDS":
-            vector_size = ast.literal_eval(child.attrib["vectorsize"])
-            #array_size = ast.literal_eval(child.attrib["arraysize"])
-            element_size = ast.literal_eval(child.attrib["datasize"])
-            datatype = child.attrib["datatype"]
-
-            offset_block_ids = offset * vector_size * element_size + ast.literal_eval(child.text)
-
-            fptr.seek(offset_block_ids)
-            if datatype == "uint" and element_size == 4:
-               data_block_ids = np.fromfile(fptr, dtype = np.uint32, count = vector_size*num_of_blocks)
-            elif datatype == "uint" and element_size == 8:
-               data_block_ids = np.fromfile(fptr, dtype = np.uint64, count = vector_size*num_of_blocks)
-            else:
-               print "Error! Bad block id data!"
-               print "Data type: " + datatype + ", element size: " + str(element_size)
-               return
+      # Read in avgs:
+      data_avgs = self.__read_block_array(fptr, self.__get_avgs_footer_entry(), offset, num_of_blocks)
 
-            data_block_ids = np.reshape(data_block_ids, (len(data_block_ids),) )
+      # Read in block coordinates:
+      block_ids_entry = self.__get_footer_entry("", "BLOCKIDS", "SpatialGrid")
+      if block_ids_entry[1] != np.uint32 and block_ids_entry[1] != np.uint64:
+         print "Error! Bad block id data!"
+         print "Data type: " + str(block_ids_entry[1])
+         return
+      data_block_ids = self.__read_block_array(fptr, block_ids_entry, offset, num_of_blocks)
+      data_block_ids = np.reshape(data_block_ids, (len(data_block_ids),) )
 
       if self.__fptr.closed:
          fptr.close()
@@ -254,57 +460,33 @@ class VlsvReader(object):
 
 
 
-   def __read_velocity_cells( self, cellid, cells_with_blocks, blocks_per_cell, cells_with_blocks_index  ):
-      # Read in the coordinates:
-      # Navigate to the correct position:
-      offset = 0
-      for i in xrange(0, cells_with_blocks_index[0]):
-         offset += blocks_per_cell[i]
+   def __read_velocity_cells( self, cellid, offset, num_of_blocks ):
+      velocity_cell_arrays = self.__read_velocity_cell_arrays(offset, num_of_blocks)
+      if velocity_cell_arrays is None:
+         return
+      (velocity_cell_ids, velocity_cell_values) = velocity_cell_arrays
+      # Make a dictionary (hash map) out of velocity cell ids and avgs:
+      return dict(zip(velocity_cell_ids.tolist(), velocity_cell_values))
 
-      num_of_blocks = np.atleast_1d(blocks_per_cell)[cells_with_blocks_index[0]]
+   def __read_velocity_cell_arrays( self, offset, num_of_blocks ):
+      ''' Reads the velocity cells of the blocks starting from the given offset
 
-      if self.__fptr.closed:
+          :returns: [velocity cell ids, values], ordered by block and by velocity cell within the block
+      '''
+      if self.__fptr.closed and not self.__use_mmap:
          fptr = open(self.file_name,"rb")
       else:
          fptr = self.__fptr
 
-      # Read in avgs and velocity cell ids:
-      for child in self.__xml_root:
-         # Read in avgs
-         if "name" in child.attrib and (child.attrib["name"] == "avgs"  or child.attrib["name"] == "proton") and (child.tag == "BLOCKVARIABLE"):
-            vector_size = ast.literal_eval(child.attrib["vectorsize"])
-            #array_size = ast.literal_eval(child.attrib["arraysize"])
-            element_size = ast.literal_eval(child.attrib["datasize"])
-            datatype = child.attrib["datatype"]
-
-            # Navigate to the correct position
-            offset_avgs = offset * vector_size * element_size + ast.literal_eval(child.text)
-
-            fptr.seek(offset_avgs)
-            if datatype == "float" and element_size == 4:
-               data_avgs = np.fromfile(fptr, dtype = np.float32, count = vector_size*num_of_blocks)
-            if datatype == "float" and element_size == 8:
-               data_avgs = np.fromfile(fptr, dtype = np.float64, count = vector_size*num_of_blocks)
-            data_avgs = data_avgs.reshape(num_of_blocks, vector_size)
-         # Read in block coordinates:
-         if "mesh" in child.attrib and child.attrib["mesh"] == "SpatialGrid" and child.tag == "BLOCKIDS":
-            vector_size = ast.literal_eval(child.attrib["vectorsize"])
-            #array_size = ast.literal_eval(child.attrib["arraysize"])
-            element_size = ast.literal_eval(child.attrib["datasize"])
-            datatype = child.attrib["datatype"]
-
-            offset_block_ids = offset * vector_size * element_size + ast.literal_eval(child.text)
-
-            fptr.seek(offset_block_ids)
-            if datatype == "uint" and element_size == 4:
-               data_block_ids = np.fromfile(fptr, dtype = np.uint32, count = vector_size*num_of_blocks)
-            elif datatype == "uint" and element_size == 8:
-               data_block_ids = np.fromfile(fptr, dtype = np.uint64, count = vector_size*num_of_blocks)
-            else:
-               print "Error! Bad data type in blocks!"
-               return
+      # Read in avgs:
+      data_avgs = self.__read_block_array(fptr, self.__get_avgs_footer_entry(), offset, num_of_blocks)
 
-            data_block_ids = data_block_ids.reshape(num_of_blocks, vector_size)
+      # Read in block coordinates:
+      block_ids_entry = self.__get_footer_entry("", "BLOCKIDS", "SpatialGrid")
+      if block_ids_entry[1] != np.uint32 and block_ids_entry[1] != np.uint64:
+         print "Error! Bad data type in blocks!"
+         return
+      data_block_ids = self.__read_block_array(fptr, block_ids_entry, offset, num_of_blocks)
 
       if self.__fptr.closed:
          fptr.close()
@@ -312,61 +494,233 @@ class VlsvReader(object):
       # Check to make sure the sizes match (just some extra debugging)
       if len(data_avgs) != len(data_block_ids):
          print "BAD DATA SIZES"
-      # Make a dictionary (hash map) out of velocity cell ids and avgs:
-      velocity_cells = {}
-      array_size = len(data_avgs)
-
-      # Construct velocity cells:
-      velocity_cell_ids = []
-      for kv in xrange(4):
-         for jv in xrange(4):
-            for iv in xrange(4):
-               velocity_cell_ids.append(kv*16 + jv*4 + iv)
-
-      for i in xrange(array_size):
-         velocity_block_id = data_block_ids[i]
-         avgIndex = 0
-         avgs = data_avgs[i]
-
-         for j in velocity_cell_ids + 64*velocity_block_id:
-            velocity_cells[(int)(j)] = avgs[avgIndex]
-            avgIndex = avgIndex + 1
-      return velocity_cells
+
+      # Construct velocity cells: every block has 64 velocity cells numbered from 64*block id on
+      velocity_cell_ids = (64*np.reshape(data_block_ids, (len(data_block_ids),1)).astype(np.int64) + np.arange(64)).ravel()
+      return [velocity_cell_ids, np.ravel(data_avgs)]
+
+   def __get_avgs_footer_entry(self):
+      ''' Returns the footer entry of the velocity block data (the avgs or proton block variable)
+      '''
+      entry = self.__get_footer_entry("avgs", "BLOCKVARIABLE", "")
+      if entry is None:
+         entry = self.__get_footer_entry("proton", "BLOCKVARIABLE", "")
+      return entry
+
+   def __get_fileindices(self, cellids, allow_missing=False):
+      ''' Returns the indices of the given cells in the arrays of the file
+
+          :param cellids:         List of cell ids
+          :param allow_missing:   If True the cell ids that are not in the file get the index -1, otherwise they raise a KeyError
+          :returns: a numpy array with the file index of each cell id
+      '''
+      if len( self.__fileindex_for_cellid ) == 0:
+         self.__read_fileindex_for_cellid()
+      cellids = np.atleast_1d(cellids).astype(np.int64)
+      if self.__sorted_cellids is None:
+         # Dense index, look the cell ids up directly
+         in_range = (cellids >= 0) & (cellids < len(self.__fileindex_for_cellid))
+         fileindices = np.where(in_range, self.__fileindex_for_cellid[np.where(in_range, cellids, 0)], -1)
+      else:
+         positions = np.minimum(np.searchsorted(self.__sorted_cellids, cellids), len(self.__sorted_cellids) - 1)
+         found = (self.__sorted_cellids[positions] == cellids)
+         fileindices = np.where(found, self.__fileindex_for_cellid[positions], -1)
+      if not allow_missing and np.any(fileindices < 0):
+         raise KeyError(cellids[fileindices < 0][0])
+      return fileindices
+
+   def __read_rows(self, fptr, entry, rows):
+      ''' Gathers the given rows of an array with a few large reads
+
+          The rows are sorted and rows that are close to each other in the file are merged into a single contiguous read, after
+          which the rows are scattered back into the requested order.
+
+          :param fptr:            Open file, not used in memory mapped mode
+          :param entry:           Footer entry of the array, see :func:`__get_footer_entry`
+          :param rows:            Indices of the rows to read, in any order and possibly repeated
+          :returns: a numpy array of shape (len(rows), vector size)
+      '''
+      # Rows closer than this are read with a single read instead of seeking past the gap
+      max_gap_size = 65536
+      (position, datatype, array_size, vector_size, offset) = entry
+      row_size = np.dtype(datatype).itemsize * vector_size
+      rows = np.asarray(rows, dtype=np.int64)
+      data = np.empty((len(rows), vector_size), dtype=datatype)
+      if len(rows) == 0:
+         return data
+      order = np.argsort(rows, kind="mergesort")
+      sorted_rows = rows[order]
+      # Split the sorted rows into runs of nearby rows
+      breaks = np.nonzero(np.diff(sorted_rows) > max(1, max_gap_size // row_size))[0] + 1
+      starts = np.concatenate(([0], breaks))
+      ends = np.concatenate((breaks, [len(rows)]))
+      for start, end in zip(starts, ends):
+         first_row = sorted_rows[start]
+         last_row = sorted_rows[end-1]
+         chunk = self.__read_array(fptr, offset + first_row * row_size, datatype, (last_row - first_row + 1) * vector_size)
+         data[order[start:end]] = chunk.reshape(-1, vector_size)[sorted_rows[start:end] - first_row]
+      return data
+
+   def __read_block_array(self, fptr, entry, offset, num_of_blocks):
+      ''' Reads num_of_blocks rows of a velocity block array starting from the block at the given offset
+
+          :param fptr:            Open file
+          :param entry:           Footer entry of the array, see :func:`__get_footer_entry`
+          :param offset:          Index of the first block to read
+          :param num_of_blocks:   Number of blocks to read
+          :returns: a numpy array of shape (num_of_blocks, vector size)
+      '''
+      (position, datatype, array_size, vector_size, array_offset) = entry
+      data = self.__read_array(fptr, array_offset + offset * vector_size * np.dtype(datatype).itemsize, datatype, vector_size*num_of_blocks)
+      return data.reshape(num_of_blocks, vector_size)
+
+   def __read_block_ranges(self, fptr, entry, offsets, counts):
+      ''' Gathers the blocks of several cells from a velocity block array with a few large reads
+
+          The cells are sorted by their position in the file and cells whose blocks are close to each other are read with a single
+          contiguous read.
+
+          :param fptr:            Open file
+          :param entry:           Footer entry of the array, see :func:`__get_footer_entry`
+          :param offsets:         Index of the first block of each cell
+          :param counts:          Number of blocks of each cell
+          :returns: a numpy array of shape (sum(counts), vector size) with the blocks of the cells concatenated in the given order
+      '''
+      # Blocks closer than this are read with a single read instead of seeking past the gap
+      max_gap_size = 65536
+      (position, datatype, array_size, vector_size, array_offset) = entry
+      max_gap_blocks = max(1, max_gap_size // (np.dtype(datatype).itemsize * vector_size))
+      data = np.empty((np.sum(counts), vector_size), dtype=datatype)
+      output_offsets = np.cumsum(counts) - counts
+      order = np.argsort(offsets, kind="mergesort")
+      order = order[counts[order] > 0]
+      i = 0
+      while i < len(order):
+         first_block = offsets[order[i]]
+         end_block = first_block + counts[order[i]]
+         j = i + 1
+         while j < len(order) and offsets[order[j]] <= end_block + max_gap_blocks:
+            end_block = max(end_block, offsets[order[j]] + counts[order[j]])
+            j = j + 1
+         chunk = self.__read_block_array(fptr, entry, first_block, end_block - first_block)
+         for k in order[i:j]:
+            data[output_offsets[k]:output_offsets[k] + counts[k]] = chunk[offsets[k] - first_block:offsets[k] - first_block + counts[k]]
+         i = j
+      return data
+
+   def __read_array(self, fptr, offset, datatype, count):
+      ''' Reads count elements of the given data type from the given file offset
+
+          :param fptr:            Open file, not used in memory mapped mode
+          :param offset:          File offset of the first element in bytes
+          :param datatype:        Numpy data type of the elements
+          :param count:           Number of elements to read
+          :returns: a numpy array with the data, in memory mapped mode a read-only view of the mapped file
+      '''
+      if self.__compressed_chunks is not None:
+         # Offsets of compressed files refer to the uncompressed data
+         data = self.__compressed_chunks.read(fptr, offset, count*np.dtype(datatype).itemsize)
+         return np.frombuffer(data, dtype=datatype)
+      if self.__use_mmap:
+         if self.__mmap is None:
+            self.__mmap = np.memmap(self.file_name, dtype=np.uint8, mode="r")
+         return self.__mmap[offset:offset + count*np.dtype(datatype).itemsize].view(datatype)
+      fptr.seek(offset)
+      return np.fromfile(fptr, dtype=datatype, count=count)
+
+   def read_array_bytes(self, fptr, offset, count):
+      ''' Reads raw bytes of the arrays of the file, e.g. for copying arrays into another file without converting them. The bytes of
+          compressed files are decompressed, see :mod:`vlsvcompression`
+
+          :param fptr:            The vlsv file of the reader, open for reading
+          :param offset:          File offset of the first byte, as given in the xml footer
+          :param count:           Number of bytes to read
+          :returns: a numpy array of the bytes (uint8)
+
+          .. code-block:: python
+
+             # Example usage:
+             child = vlsvReader.get_xml_root().find("VARIABLE")
+             fptr = open(vlsvReader.file_name, "rb")
+             data = vlsvReader.read_array_bytes(fptr, int(child.text), int(child.attrib["arraysize"]) * int(child.attrib["vectorsize"]) * int(child.attrib["datasize"]))
+             fptr.close()
+
+          .. seealso:: :func:`get_xml_root`
+      '''
+      return self.__read_array(fptr, offset, np.uint8, count)
 
    def __set_cell_offset_and_blocks(self):
-      ''' Read blocks per cell and the offset in the velocity space arrays for every cell with blocks into a private dictionary
+      ''' Read blocks per cell and the offset in the velocity space arrays for every cell with blocks into private index arrays
+
+          The arrays are sorted by cell id: the cell ids with blocks, the index of the first block of each cell (prefix sums of
+          blocks per cell in file order) and the number of blocks of each cell.
       '''
-      if len(self.__fileindex_for_cellid_blocks) != 0:
-         # There's stuff already saved into the dictionary, don't save it again
+      if len(self.__blocks_cellids) != 0:
+         # There's stuff already saved into the index, don't save it again
          return
       #these two arrays are in the same order: 
       #list of cells for which dist function is saved
       cells_with_blocks = self.read(mesh="SpatialGrid",tag="CELLSWITHBLOCKS")
       #number of blocks in each cell for which data is stored
       blocks_per_cell = self.read(mesh="SpatialGrid",tag="BLOCKSPERCELL")
+      if cells_with_blocks is None or blocks_per_cell is None:
+         return
+      cells_with_blocks = np.atleast_1d(cells_with_blocks).astype(np.int64)
+      blocks_per_cell = np.atleast_1d(blocks_per_cell).astype(np.int64)
 
       # Navigate to the correct position:
-      from copy import copy
-      offset = 0
-      self.__fileindex_for_cellid_blocks = {}
-      for i in xrange(0, len(cells_with_blocks)):
-         self.__fileindex_for_cellid_blocks[cells_with_blocks[i]] = [copy(offset), copy(blocks_per_cell[i])]
-         offset += blocks_per_cell[i]
+      offsets = np.zeros(len(blocks_per_cell), dtype=np.int64)
+      offsets[1:] = np.cumsum(blocks_per_cell)[:-1]
+      order = np.argsort(cells_with_blocks, kind="mergesort")
+      self.__blocks_cellids = cells_with_blocks[order]
+      self.__blocks_offsets = offsets[order]
+      self.__blocks_counts = blocks_per_cell[order]
+
+   def __get_cell_blocks(self, cellid):
+      ''' Returns the index of the first velocity block of a cell in the velocity block arrays and the number of its blocks
+
+          :param cellid:          The cell's ID
+          :returns: (offset, number of blocks) or None if the cell has no blocks
+      '''
+      self.__set_cell_offset_and_blocks()
+      if len(self.__blocks_cellids) == 0:
+         return None
+      position = np.searchsorted(self.__blocks_cellids, cellid)
+      if position >= len(self.__blocks_cellids) or self.__blocks_cellids[position] != cellid:
+         return None
+      return (self.__blocks_offsets[position], self.__blocks_counts[position])
+
+   def __get_cells_blocks(self, cellids):
+      ''' Returns the index of the first velocity block and the number of blocks of several cells
+
+          :param cellids:         List of cell ids
+          :returns: numpy arrays of the offsets and the numbers of blocks, both zero for the cells without blocks
+      '''
+      self.__set_cell_offset_and_blocks()
+      cellids = np.atleast_1d(cellids).astype(np.int64)
+      if len(self.__blocks_cellids) == 0:
+         return (np.zeros(len(cellids), dtype=np.int64), np.zeros(len(cellids), dtype=np.int64))
+      positions = np.minimum(np.searchsorted(self.__blocks_cellids, cellids), len(self.__blocks_cellids) - 1)
+      found = (self.__blocks_cellids[positions] == cellids)
+      offsets = np.where(found, self.__blocks_offsets[positions], 0)
+      counts = np.where(found, self.__blocks_counts[positions], 0)
+      return (offsets, counts)
 
    def list(self):
       ''' Print out a description of the content of the file. Useful
          for interactive usage
       '''
+      xml_root = self.__get_xml_root()
       print "tag = PARAMETER"
-      for child in self.__xml_root:
+      for child in xml_root:
          if child.tag == "PARAMETER" and "name" in child.attrib:
             print "   ", child.attrib["name"]
       print "tag = VARIABLE"
-      for child in self.__xml_root:
+      for child in xml_root:
          if child.tag == "VARIABLE" and "name" in child.attrib:
             print "   ", child.attrib["name"]
       print "tag = MESH"
-      for child in self.__xml_root:
+      for child in xml_root:
          if child.tag == "MESH" and "name" in child.attrib:
             print "   ", child.attrib["name"]
       print "Datareducers:"
@@ -376,7 +730,7 @@ class VlsvReader(object):
       for name in data_operators:
          print "   ",name
       print "Other:"
-      for child in self.__xml_root:
+      for child in xml_root:
          if child.tag != "PARAMETER" and child.tag != "VARIABLE" and child.tag != "MESH":
             print "    tag = ", child.tag, " mesh = ", child.attrib["mesh"]
 
@@ -399,11 +753,10 @@ class VlsvReader(object):
                 # Variaable not in the vlsv file
                 plot_B_vol()
       '''
-      for child in self.__xml_root:
-         if child.tag == "VARIABLE" and "name" in child.attrib:
-            if child.attrib["name"] == name:
-               return True
-      return False
+      while ("VARIABLE", name, "") not in self.__footer_index:
+         if not self.__parse_xml_footer():
+            return False
+      return True
 
    def get_all_variables( self ):
       ''' Returns all variables in the vlsv reader and the data reducer
@@ -414,17 +767,36 @@ class VlsvReader(object):
              vars = vlsvReader.get_variables()
       '''
       varlist = [];
-      for child in self.__xml_root:
-         if child.tag == "VARIABLE" and "name" in child.attrib:
-            varlist.append(child.attrib["name"])
+      self.__get_xml_root()
+      for (name, mesh, entry) in self.__footer_entries.get("VARIABLE", []):
+         if name is not None:
+            varlist.append(name)
       return varlist
 
    def get_cellid_locations(self):
       ''' Returns a dictionary with cell id as the key and the index of the cell id as the value. The index is used to locate the cell id's values in the arrays that this reader returns
+
+          .. note:: The dictionary is built on every call, use :func:`get_fileindices` for looking up many cell ids
       '''
-      if len( self.__fileindex_for_cellid ) == 0:
-         self.__read_fileindex_for_cellid()
-      return self.__fileindex_for_cellid
+      cellids = np.atleast_1d(self.read(mesh="SpatialGrid",name="CellID", tag="VARIABLE"))
+      return dict(zip(cellids, xrange(len(cellids))))
+
+   def get_fileindices(self, cellids):
+      ''' Returns the indices of the given cell ids in the arrays that this reader returns
+
+          :param cellids:         Cell id or a list of cell ids
+          :returns: a numpy array with the index of every cell id
+
+          .. code-block:: python
+
+             # Example usage:
+             vlsvReader = VlsvReader("bulk.0001234.vlsv")
+             rho = vlsvReader.read_variable("rho")
+             rho_of_cells = rho[vlsvReader.get_fileindices([12, 4, 1003])]
+
+          .. note:: Raises a KeyError if a cell id is not in the file
+      '''
+      return self.__get_fileindices(cellids)
 
    def read(self, name="", tag="", mesh="", operator="pass", read_single_cellid=-1):
       ''' Read data from the open vlsv file. 
@@ -433,70 +805,130 @@ class VlsvReader(object):
       :param tag:  Tag of the data array.
       :param mesh: Mesh for the data array
       :param operator: Datareduction operator. "pass" does no operation on data.
-      :param read_single_cellid:  If -1 then all data is read. If nonzero then only the vector for the specified cell id is read
+      :param read_single_cellid:  If -1 then all data is read. If nonzero then only the vector for the specified cell id is read. If a list of cell ids then the vectors of the given cells are read in the given order
       :returns: numpy array with the data
 
       .. seealso:: :func:`read_variable` :func:`read_variable_info`
+
+      .. note:: If the reader has a variable cache, the returned arrays are shared with the cache and are read-only
+      '''
+      cache = self.get_variable_cache()
+      if cache is None:
+         return self.__read(name, tag, mesh, operator, read_single_cellid)
+      key = self.__get_cache_key(name, tag, mesh, operator, read_single_cellid)
+      data = cache.get(key)
+      if data is None:
+         data = self.__read(name, tag, mesh, operator, read_single_cellid)
+         if data is not None:
+            data = cache.put(key, data)
+      return data
+
+   def __get_cache_key(self, name, tag, mesh, operator, read_single_cellid):
+      ''' Returns the key of an array in the variable cache
       '''
+      if np.ndim(read_single_cellid) > 0:
+         selection = ("cellids", np.asarray(read_single_cellid, dtype=np.int64).tostring())
+      else:
+         selection = int(read_single_cellid)
+      return self.__file_signature + (name, tag, mesh, operator, selection)
 
-      if (len( self.__fileindex_for_cellid ) == 0):
-         if read_single_cellid >= 0:
-            self.__read_fileindex_for_cellid()
+   def __evaluate_datareducers(self, names, tag, mesh, read_single_cellid, cached_names):
+      ''' Evaluates the datareducers needed for the given variables so that every stored variable is read once and every
+          intermediate datareducer is evaluated once
+
+          :param names:              List of the requested variables
+          :param cached_names:       If False the requested variables are not looked up from or added to the variable cache
+          :returns: a dictionary with the requested, intermediate and stored variables by name
+      '''
+      is_stored = lambda name: self.__get_footer_entry(name, tag, mesh) is not None
+      cache = self.get_variable_cache()
+      values = {}
+      for name in get_datareducer_evaluation_order(names, is_stored):
+         if name not in datareducers or datareducers[name].useVspace or is_stored(name):
+            values[name] = self.read(name, tag, mesh, "pass", read_single_cellid)
+            continue
+         reducer = datareducers[name]
+         use_cache = cache is not None and (cached_names or name not in names)
+         data = None
+         if use_cache:
+            key = self.__get_cache_key(name, tag, mesh, "pass", read_single_cellid)
+            data = cache.get(key)
+         if data is None:
+            data = reducer.operation( [values[i] for i in reducer.variables] )
+            if use_cache and data is not None:
+               data = cache.put(key, data)
+         values[name] = data
+      return values
+
+   def get_variable_cache(self):
+      ''' Returns the variable cache used by the reader, None if there is no cache
+
+          .. seealso:: :func:`set_variable_cache`
+      '''
+      if self.__variable_cache is None:
+         return variablecache.get_global_variable_cache()
+      return self.__variable_cache
+
+   def set_variable_cache(self, variable_cache):
+      ''' Sets the variable cache of the reader
+
+          :param variable_cache: A :class:`variablecache.VariableCache`, which may be shared with other readers, or None to use the global cache
+
+          .. code-block:: python
+
+             # Example usage:
+             cache = VariableCache(max_bytes=4*1024**3)
+             for f in ["bulk.0001234.vlsv", "bulk.0001235.vlsv"]:
+                vlsvReader = VlsvReader(f)
+                vlsvReader.set_variable_cache(cache)
+      '''
+      self.__variable_cache = variable_cache
+
+   def __read(self, name, tag, mesh, operator, read_single_cellid):
+      ''' Reads data from the open vlsv file, see :func:`read`
+      '''
+      read_multiple_cellids = (np.ndim(read_single_cellid) > 0)
       if tag == "" and name == "" and tag == "":
          print "Bad arguments at read"
 
-      if self.__fptr.closed:
+      if self.__fptr.closed and not self.__use_mmap:
          fptr = open(self.file_name,"rb")
       else:
          fptr = self.__fptr
 
-      #TODO, read_single_cellid should perhaps be an list/numpy array with cellids that are read in. This could be more efficient to 
-      #     study multiple cells, e.g., along a line
-      for child in self.__xml_root:
-         if tag != "":
-            if child.tag != tag:
-               continue
-         if name != "":
-            if "name" in child.attrib and child.attrib["name"] != name:
-               continue
-         if mesh != "":
-            if "mesh" in child.attrib and child.attrib["mesh"] != mesh:
-               continue
-         if child.tag == tag:
-            vector_size = ast.literal_eval(child.attrib["vectorsize"])
-            array_size = ast.literal_eval(child.attrib["arraysize"])
-            element_size = ast.literal_eval(child.attrib["datasize"])
-            datatype = child.attrib["datatype"]
-            offset = ast.literal_eval(child.text)
+      entry = self.__get_footer_entry(name, tag, mesh)
+      if entry is not None:
+         (position, datatype, array_size, vector_size, offset) = entry
+         if datatype is None:
+            print "Bad data type in array " + name + " at read"
+            if self.__fptr.closed:
+               fptr.close()
+            return
+         if read_multiple_cellids:
+            data = self.__read_rows(fptr, entry, self.__get_fileindices(read_single_cellid))
+            array_size = len(data)
+         else:
             if read_single_cellid >= 0:
-               offset=offset+self.__fileindex_for_cellid[read_single_cellid]*element_size*vector_size
+               offset=offset+self.__get_fileindices([read_single_cellid])[0]*np.dtype(datatype).itemsize*vector_size
                array_size=1
+            data = self.__read_array(fptr, offset, datatype, vector_size*array_size)
 
-            fptr.seek(offset)
-
-            if datatype == "float" and element_size == 4:
-               data = np.fromfile(fptr, dtype = np.float32, count=vector_size*array_size)
-            if datatype == "float" and element_size == 8:
-               data = np.fromfile(fptr, dtype=np.float64, count=vector_size*array_size)
-            if datatype == "int" and element_size == 4:
-               data = np.fromfile(fptr, dtype=np.int32, count=vector_size*array_size)
-            if datatype == "int" and element_size == 8:
-               data = np.fromfile(fptr, dtype=np.int64, count=vector_size*array_size)
-            if datatype == "uint" and element_size == 4:
-               data = np.fromfile(fptr, dtype=np.uint32, count=vector_size*array_size)
-            if datatype == "uint" and element_size == 8:
-               data = np.fromfile(fptr, dtype=np.uint64, count=vector_size*array_size)
+         if self.__fptr.closed:
+            fptr.close()
 
-            if self.__fptr.closed:
-               fptr.close()
+         if read_multiple_cellids:
+            # Keep the cell axis even when only one cell was requested
+            if vector_size == 1:
+               data=data.reshape(array_size)
+            return data_operators[operator](data)
 
-            if vector_size > 1:
-               data=data.reshape(array_size, vector_size)
-            
-            if array_size == 1:
-               return data_operators[operator](data[0])
-            else:
-               return data_operators[operator](data)
+         if vector_size > 1:
+            data=data.reshape(array_size, vector_size)
+
+         if array_size == 1:
+            return data_operators[operator](data[0])
+         else:
+            return data_operators[operator](data)
 
       # Check if the name is in datareducers
       if name in datareducers:
@@ -505,27 +937,18 @@ class VlsvReader(object):
        
          # Return the output of the datareducer
          if reducer.useVspace:
-            cellids = self.read(mesh="SpatialGrid", name="CellID", tag="VARIABLE", operator=operator, read_single_cellid=read_single_cellid)
-            output = np.zeros(len(cellids))
-            index = 0
-            for cellid in cellids:
-               velocity_cell_data = self.read_velocity_cells(cellid)
-               # Get cells:
-               vcellids = velocity_cell_data.keys()
-               # Get coordinates:
-               velocity_coordinates = self.get_velocity_cell_coordinates(vcellids)
-               tmp_vars = []
-               for i in np.atleast_1d(reducer.variables):
-                  tmp_vars.append( self.read( i, tag, mesh, "pass", cellid ) )
-               output[index] = reducer.operation( tmp_vars , velocity_cell_data, velocity_coordinates )
-               index+=1
-               print index,"/",len(cellids)
+            # Evaluated serially here, see read_vspace_variable for evaluating with several processes
+            if read_multiple_cellids or read_single_cellid >= 0:
+               cellids = read_single_cellid
+            else:
+               cellids = self.read(mesh="SpatialGrid", name="CellID", tag="VARIABLE")
+            output = vspaceengine.evaluate_vspace_reducer(self, name, tag, mesh, cellids, processes=1)
+            if not read_multiple_cellids and read_single_cellid >= 0:
+               output = output[0]
             return data_operators[operator](output)
          else:
-            tmp_vars = []
-            for i in np.atleast_1d(reducer.variables):
-               tmp_vars.append( self.read( i, tag, mesh, "pass", read_single_cellid ) )
-            return data_operators[operator](reducer.operation( tmp_vars ))
+            values = self.__evaluate_datareducers([name], tag, mesh, read_single_cellid, False)
+            return data_operators[operator](values[name])
 
       if self.__fptr.closed:
          fptr.close()
@@ -534,10 +957,17 @@ class VlsvReader(object):
       ''' Read a linearly interpolated variable value from the open vlsv file.
       Arguments:
       :param name: Name of the variable
-      :param coords: Coordinates from which to read data 
+      :param coords: Coordinates from which to read data, or an array of shape (N,3) of coordinates
       :param periodic: Periodicity of the system. Default is periodic in all dimension
       :param operator: Datareduction operator. "pass" does no operation on data
-      :returns: numpy array with the data
+      :returns: numpy array with the data. For N coordinates an array with N rows, NaN for the points outside the domain or next to cells that are not in the file
+
+      .. code-block:: python
+
+         # Example usage:
+         # The 8 neighbors of all points are read with a single gather:
+         x = np.linspace(-1e8, 1e8, 100000)
+         B = vlsvReader.read_interpolated_variable("B", np.array([x, np.zeros(len(x)), np.zeros(len(x))]).transpose())
 
       .. seealso:: :func:`read` :func:`read_variable_info`
       '''
@@ -605,14 +1035,61 @@ class VlsvReader(object):
 
       else:
          #multiple coordinates
-         pass
+         coordinates = np.asarray(coordinates, dtype=float)
+         closest_cell_ids = self.get_cellid(coordinates)
+         points = np.nonzero(closest_cell_ids != 0)[0]
+         closest_cell_coordinates = self.get_cell_coordinates(closest_cell_ids[points])
+
+         #now identify the lower one of the 8 neighbor cells of every point
+         offsets = np.where(coordinates[points] > closest_cell_coordinates, 0, -1)
+         lower_cell_ids = self.get_cell_neighbor(closest_cell_ids[points], offsets, periodic)
+         lower_cell_coordinates = self.get_cell_coordinates(lower_cell_ids)
+         upper_cell_ids = self.get_cell_neighbor(lower_cell_ids, [1,1,1], periodic)
+         upper_cell_coordinates = self.get_cell_coordinates(upper_cell_ids)
+         cell_distances = upper_cell_coordinates - lower_cell_coordinates
+         #Special case for periodic systems with one cell in a dimension
+         scaled_coordinates = np.where(cell_distances != 0, (coordinates[points] - lower_cell_coordinates)/np.where(cell_distances != 0, cell_distances, 1.0), 0.0)
+
+         #now identify 8 cells of every point, starting from the lower one, and read their values with a single gather
+         ngbr_cell_ids = np.zeros((len(points),2,2,2))
+         for x in [0,1]:
+            for y in [0,1]:
+               for z in [0,1]:
+                  ngbr_cell_ids[:,x,y,z] = self.get_cell_neighbor(lower_cell_ids, [x,y,z], periodic)
+         (unique_cell_ids, ngbr_indices) = np.unique(ngbr_cell_ids, return_inverse=True)
+         ngbr_indices = ngbr_indices.reshape(ngbr_cell_ids.shape)
+         found = (self.__get_fileindices(unique_cell_ids, allow_missing=True) >= 0)
+         complete = np.all(found[ngbr_indices].reshape(len(points), 8), axis=1)
+         if np.any(found):
+            found_values = self.read_variable(name, unique_cell_ids[found], operator)
+         else:
+            # Only for the shape of the values
+            found_values = self.read_variable(name, self.read_variable("CellID")[:1], operator)[:0]
+         value_shape = np.shape(found_values)[1:]
+         value_length = int(np.prod(value_shape))
+         unique_values = np.zeros((len(unique_cell_ids), value_length))
+         unique_values[found] = np.reshape(found_values, (-1, value_length))
+         ngbrvalues = unique_values[ngbr_indices]
+
+         #blend the values in the same order as for a single point
+         sx = scaled_coordinates[:,0,np.newaxis,np.newaxis,np.newaxis]
+         c2d = ngbrvalues[:,0,:,:,:] * (1 - sx) + ngbrvalues[:,1,:,:,:] * sx
+         sy = scaled_coordinates[:,1,np.newaxis,np.newaxis]
+         c1d = c2d[:,0,:,:] * (1 - sy) + c2d[:,1,:,:] * sy
+         sz = scaled_coordinates[:,2,np.newaxis]
+         final_values = c1d[:,0,:] * (1 - sz) + c1d[:,1,:] * sz
+
+         output = np.empty((len(coordinates), value_length))
+         output[:] = np.nan
+         output[points[complete]] = final_values[complete]
+         return output.reshape((len(coordinates),) + value_shape)
 
 
    def read_variable(self, name, cellids=-1,operator="pass"):
       ''' Read variables from the open vlsv file. 
       Arguments:
       :param name: Name of the variable
-      :param cellids: a value of -1 reads all data
+      :param cellids: a value of -1 reads all data, a list of cell ids reads the data of the given cells with a single gather
       :param operator: Datareduction operator. "pass" does no operation on data
       :returns: numpy array with the data
 
@@ -622,11 +1099,122 @@ class VlsvReader(object):
       if len(np.shape(cellids)) == 0:
          return self.read(mesh="SpatialGrid", name=name, tag="VARIABLE", operator=operator, read_single_cellid=cellids)
       else:
-         # NOTE: Should the file read be optimized by opening the file here until all cellids have been read? It can be optimized by the user manually, as well
-         variable = []
-         for i in cellids:
-            variable.append( self.read(mesh="SpatialGrid", name=name, tag="VARIABLE", operator=operator, read_single_cellid=i) )
-         return np.array(variable, copy=False)
+         # Read all of the cells at once
+         return np.array(self.read(mesh="SpatialGrid", name=name, tag="VARIABLE", operator=operator, read_single_cellid=np.asarray(cellids)), copy=False)
+
+   def read_variables(self, names, cellids=-1, operator="pass"):
+      ''' Read several variables from the open vlsv file. The variables shared by the datareducers of the requested variables are
+      read and evaluated only once
+      Arguments:
+      :param names: List of names of the variables
+      :param cellids: a value of -1 reads all data, a list of cell ids reads the data of the given cells
+      :param operator: Datareduction operator applied to every variable. "pass" does no operation on data
+      :returns: list of numpy arrays with the data of each variable
+
+      .. code-block:: python
+
+         # Example usage:
+         # PTensor, PParallel and B are evaluated once for all three variables:
+         [beta, Rmirror, Dng] = vlsvReader.read_variables(["beta", "Rmirror", "Dng"])
+
+      .. seealso:: :func:`read_variable`
+      '''
+      cellids = get_data(cellids)
+      if len(np.shape(cellids)) > 0:
+         cellids = np.asarray(cellids)
+      values = self.__evaluate_datareducers(list(names), "VARIABLE", "SpatialGrid", cellids, True)
+      result = []
+      for name in names:
+         data = data_operators[operator](values[name])
+         if len(np.shape(cellids)) > 0:
+            data = np.array(data, copy=False)
+         result.append(data)
+      return result
+
+   def read_variable_grid(self, name, operator="pass", out=None, collapse=True):
+      ''' Read a variable of all cells as a structured grid. The cells are put in the order of their cell ids with the
+      permutation of the file, which is computed once and kept by the reader
+      Arguments:
+      :param name: Name of the variable, or an array of values in the order of the cells in the file
+      :param operator: Datareduction operator, applied when the variable is read by name. "pass" does no operation on data
+      :param out: A C-contiguous array of the right shape into which the grid is written (OPTIONAL)
+      :param collapse: If True the dimensions with only one cell are left out, e.g. (ny,nx) for a run in the x-y plane
+      :returns: C-contiguous numpy array of shape (nz,ny,nx) for scalars or (nz,ny,nx,vector size) for vectors, indexed as [z,y,x]. Cells that are not in the file are NaN (0 for integer data)
+
+      .. code-block:: python
+
+         # Example usage:
+         rho = vlsvReader.read_variable_grid("rho")
+         pl.pcolormesh(rho)
+         # Reuse a buffer for the same variable from a series of files:
+         B = vlsvReader.read_variable_grid("B")
+         for vlsvReader in vlsvReaders:
+            vlsvReader.read_variable_grid("B", out=B)
+
+      .. seealso:: :func:`read_variable`
+      '''
+      if isinstance(name, basestring):
+         data = self.read_variable(name, operator=operator)
+      else:
+         data = name
+      data = np.asarray(data)
+      grid_fileindices = self.__get_grid_fileindices()
+      sizes = [int(self.__zcells), int(self.__ycells), int(self.__xcells)]
+      if collapse:
+         sizes = [size for size in sizes if size > 1]
+      shape = tuple(sizes) + np.shape(data)[1:]
+      if out is None:
+         out = np.empty(shape, dtype=data.dtype)
+      elif out.shape != shape or not out.flags.c_contiguous:
+         raise ValueError("out must be a C-contiguous array of shape " + str(shape) + " at read_variable_grid")
+      # A view of the output with one row per cell
+      cells = out.reshape((len(grid_fileindices),) + np.shape(data)[1:])
+      found = (grid_fileindices >= 0)
+      if np.all(found) and cells.dtype == data.dtype:
+         np.take(data, grid_fileindices, axis=0, out=cells)
+      else:
+         cells[found] = data[grid_fileindices[found]]
+         cells[~found] = np.nan if cells.dtype.kind in "fc" else 0
+      return out
+
+   def __get_grid_fileindices(self):
+      ''' Returns the file index of every cell of the spatial grid in the order of cell ids, -1 for cells that are not in the file
+      '''
+      if self.__grid_fileindices is None:
+         number_of_cells = int(self.__xcells) * int(self.__ycells) * int(self.__zcells)
+         self.__grid_fileindices = self.__get_fileindices(np.arange(1, number_of_cells + 1), allow_missing=True)
+      return self.__grid_fileindices
+
+   def read_vspace_variable(self, name, cellids=-1, operator="pass", processes=None, progress=None):
+      ''' Read a datareducer that uses velocity space data, evaluating the cells in a pool of worker processes. Each worker
+      keeps its own reader of the file open
+      Arguments:
+      :param name: Name of the datareducer
+      :param cellids: a value of -1 reads all data, a list of cell ids reads the data of the given cells
+      :param operator: Datareduction operator. "pass" does no operation on data
+      :param processes: Number of worker processes, None for one per cpu and 1 for evaluating in this process
+      :param progress: Function called as progress(done, total) with the number of evaluated cells with a velocity distribution (OPTIONAL)
+      :returns: numpy array with the data, NaN for the cells without a velocity distribution
+
+      .. code-block:: python
+
+         # Example usage:
+         def progress( done, total ):
+            print done, "/", total
+         gyrophase_relstddev = vlsvReader.read_vspace_variable("gyrophase_relstddev", processes=8, progress=progress)
+
+      .. seealso:: :func:`read_variable`
+      '''
+      if name not in datareducers or not datareducers[name].useVspace:
+         print "Variable " + name + " is not a velocity space datareducer"
+         return
+      cellids = get_data(cellids)
+      if len(np.shape(cellids)) == 0 and cellids < 0:
+         cellids = self.read(mesh="SpatialGrid", name="CellID", tag="VARIABLE")
+      output = vspaceengine.evaluate_vspace_reducer(self, name, "VARIABLE", "SpatialGrid", cellids, processes=processes, progress=progress)
+      if len(np.shape(cellids)) == 0:
+         output = output[0]
+      return data_operators[operator](output)
 
    def read_variable_info(self, name, cellids=-1, operator="pass"):
       ''' Read variables from the open vlsv file and input the data into VariableInfo
@@ -653,32 +1241,57 @@ class VlsvReader(object):
    def get_cellid(self, coordinates):
       ''' Returns the cell id at given coordinates
 
-      :param coordinates:        The cell's coordinates
-      :returns: the cell id
+      :param coordinates:        The cell's coordinates, or an array of shape (N,3) of coordinates
+      :returns: the cell id, or a numpy array of the N cell ids
+
+      .. code-block:: python
+
+         # Example usage:
+         x = np.linspace(-1e8, 1e8, 1000)
+         cellids = vlsvReader.get_cellid(np.array([x, np.zeros(len(x)), np.zeros(len(x))]).transpose())
+         rho = vlsvReader.read_variable("rho", cellids[cellids != 0])
 
       .. note:: Returns 0 if the cellid is out of bounds!
       '''
-      # Check that the coordinates are not out of bounds:
-      if (self.__xmax < coordinates[0]) or (self.__xmin > coordinates[0]):
-         return 0
-      if (self.__ymax < coordinates[1]) or (self.__ymin > coordinates[1]):
-         return 0
-      if (self.__zmax < coordinates[2]) or (self.__zmin > coordinates[2]):
-         return 0
+      coordinates = np.asarray(coordinates, dtype=float)
+      mins = np.array([self.__xmin, self.__ymin, self.__zmin])
+      maxs = np.array([self.__xmax, self.__ymax, self.__zmax])
       # Get cell lengths:
       cell_lengths = np.array([self.__dx, self.__dy, self.__dz])
-   
-      # Get cell indices:
-      cellindices = np.array([(int)((coordinates[0] - self.__xmin)/(float)(cell_lengths[0])), (int)((coordinates[1] - self.__ymin)/(float)(cell_lengths[1])), (int)((coordinates[2] - self.__zmin)/(float)(cell_lengths[2]))])
+      # Check that the coordinates are not out of bounds:
+      inside = np.all((coordinates >= mins) & (coordinates <= maxs), axis=-1)
+      # Get cell indices, the upper boundary belongs to the last cell:
+      cellindices = ((np.where(inside[...,np.newaxis], coordinates, mins) - mins)/cell_lengths).astype(np.int64)
+      cellindices = np.minimum(cellindices, np.array([self.__xcells, self.__ycells, self.__zcells]) - 1)
       # Get the cell id:
-      cellid = cellindices[0] + cellindices[1] * self.__xcells + cellindices[2] * self.__xcells * self.__ycells + 1
-      return cellid
+      cellids = cellindices[...,0] + cellindices[...,1] * self.__xcells + cellindices[...,2] * self.__xcells * self.__ycells + 1
+      cellids = np.where(inside, cellids, 0)
+      if np.ndim(cellids) == 0:
+         return cellids[()]
+      return cellids
+
+   def get_cellids_in_box(self, bounding_box):
+      ''' Returns the cell ids of the cells whose centers are inside a box
+
+      :param bounding_box:       The box as [xmin, ymin, zmin, xmax, ymax, zmax]
+      :returns: a sorted numpy array of cell ids
+
+      .. code-block:: python
+
+         # Example usage:
+         cellids = vlsvReader.get_cellids_in_box([6e7, -3e7, -1e6, 9e7, 3e7, 1e6])
+         rho = vlsvReader.read_variable("rho", cellids)
+      '''
+      cellids = np.sort(self.read_variable("CellID"))
+      coordinates = self.get_cell_coordinates(cellids)
+      inside = np.all((coordinates >= np.asarray(bounding_box[:3])) & (coordinates <= np.asarray(bounding_box[3:])), axis=1)
+      return cellids[inside]
 
    def get_cell_coordinates(self, cellid):
       ''' Returns a given cell's coordinates as a numpy array
 
-      :param cellid:            The cell's ID
-      :returns: a numpy array with the coordinates
+      :param cellid:            The cell's ID, or an array of N cell ids
+      :returns: a numpy array with the coordinates, of shape (N,3) for N cell ids
 
       .. seealso:: :func:`get_cellid`
 
@@ -687,68 +1300,53 @@ class VlsvReader(object):
       # Get cell lengths:
       cell_lengths = np.array([(self.__xmax - self.__xmin)/(float)(self.__xcells), (self.__ymax - self.__ymin)/(float)(self.__ycells), (self.__zmax - self.__zmin)/(float)(self.__zcells)])
       # Get cell indices:
-      cellid = (int)(cellid - 1)
-      cellindices = np.zeros(3)
-      cellindices[0] = (int)(cellid)%(int)(self.__xcells)
-      cellindices[1] = ((int)(cellid)/(int)(self.__xcells))%(int)(self.__ycells)
-      cellindices[2] = (int)(cellid)/(int)(self.__xcells*self.__ycells)
-   
+      cellindices = self.get_cell_indices(cellid)
       # Get cell coordinates:
-      cellcoordinates = np.zeros(3)
-      cellcoordinates[0] = self.__xmin + (cellindices[0] + 0.5) * cell_lengths[0]
-      cellcoordinates[1] = self.__ymin + (cellindices[1] + 0.5) * cell_lengths[1]
-      cellcoordinates[2] = self.__zmin + (cellindices[2] + 0.5) * cell_lengths[2]
-      # Return the coordinates:
-      return np.array(cellcoordinates)
+      return np.array([self.__xmin, self.__ymin, self.__zmin]) + (cellindices + 0.5) * cell_lengths
 
    def get_cell_indices(self, cellid):
       ''' Returns a given cell's indices as a numpy array
 
-      :param cellid:            The cell's ID
-      :returns: a numpy array with the coordinates
+      :param cellid:            The cell's ID, or an array of N cell ids
+      :returns: a numpy array with the indices, of shape (N,3) for N cell ids
 
       .. seealso:: :func:`get_cellid`
 
       .. note:: The cell ids go from 1 .. max not from 0
       '''
       # Get cell indices:
-      cellid = (int)(cellid - 1)
-      cellindices = np.zeros(3)
-      cellindices[0] = (int)(cellid)%(int)(self.__xcells)
-      cellindices[1] = ((int)(cellid)/(int)(self.__xcells))%(int)(self.__ycells)
-      cellindices[2] = (int)(cellid)/(int)(self.__xcells*self.__ycells)
-      # Return the coordinates:
-      return np.array(cellindices)
+      cellid = np.asarray(cellid).astype(np.int64) - 1
+      cellindices = np.zeros(np.shape(cellid) + (3,))
+      cellindices[...,0] = cellid % self.__xcells
+      cellindices[...,1] = (cellid // self.__xcells) % self.__ycells
+      cellindices[...,2] = cellid // (self.__xcells * self.__ycells)
+      # Return the indices:
+      return cellindices
 
    def get_cell_neighbor(self, cellid, offset, periodic):
       ''' Returns a given cells neighbor at offset (in indices)
 
-      :param cellid:            The cell's ID
-      :param offset:            The offset to the neighbor in indices
+      :param cellid:            The cell's ID, or an array of N cell ids
+      :param offset:            The offset to the neighbor in indices, or an array of shape (N,3) of offsets
       :param periodic:          For each dimension, is the system periodic
-      :returns: the cellid of the neighbor
+      :returns: the cellid of the neighbor, or a numpy array of the N cell ids of the neighbors
 
       .. note:: Returns 0 if the offset is out of bounds!
 
       '''
       indices = self.get_cell_indices(cellid)
-      ngbr_indices = np.zeros(3)
-      sys_size = [self.__xcells, self.__ycells, self.__zcells]
-      for i in range(3):
-         ngbr_indices[i] = indices[i] + offset[i]
-         if periodic[i]:
-            for j in range(abs(offset[i])):
-               #loop over offset abs as offset may be larger than the system size
-               if ngbr_indices[i] < 0:
-                  ngbr_indices[i] = ngbr_indices[i] + sys_size[i]
-               elif ngbr_indices[i] >= sys_size[i]:
-                  ngbr_indices[i] = ngbr_indices[i] - sys_size[i]
-   
-         elif ngbr_indices[i] < 0 or  ngbr_indices[i] >= sys_size[i]:
-            #out of bounds
-            return 0
-
-      return  ngbr_indices[0] + ngbr_indices[1] * self.__xcells + ngbr_indices[2] * self.__xcells * self.__ycells + 1
+      sys_size = np.array([self.__xcells, self.__ycells, self.__zcells])
+      ngbr_indices = indices + np.asarray(offset)
+      # Wrap the periodic dimensions, the offset may be larger than the system size
+      periodic = np.array([bool(periodic[i]) for i in xrange(3)])
+      ngbr_indices = np.where(periodic, np.mod(ngbr_indices, sys_size), ngbr_indices)
+      # Out of bounds in the other dimensions:
+      inside = np.all((ngbr_indices >= 0) & (ngbr_indices < sys_size), axis=-1)
+      cellids = ngbr_indices[...,0] + ngbr_indices[...,1] * self.__xcells + ngbr_indices[...,2] * self.__xcells * self.__ycells + 1
+      cellids = np.where(inside, cellids, 0)
+      if np.ndim(cellids) == 0:
+         return cellids[()]
+      return cellids
 
 
 
@@ -761,27 +1359,33 @@ class VlsvReader(object):
 
       .. seealso:: :func:`get_cell_coordinates` :func:`get_velocity_block_coordinates`
       '''
-      vcellids = np.atleast_1d(vcellids)
+      vcellids = np.atleast_1d(vcellids).astype(np.int64)
       # Get block ids:
-      blocks = vcellids.astype(int) / 64
+      blocks = vcellids // 64
       # Get block coordinates:
-      blockIndicesX = np.remainder(blocks.astype(int), (int)(self.__vxblocks))
-      blockIndicesY = np.remainder(blocks.astype(int)/(int)(self.__vxblocks), (int)(self.__vyblocks))
-      blockIndicesZ = blocks.astype(int)/(int)(self.__vxblocks*self.__vyblocks)
-      blockCoordinatesX = blockIndicesX.astype(float) * self.__dvx * 4 + self.__vxmin
-      blockCoordinatesY = blockIndicesY.astype(float) * self.__dvy * 4 + self.__vymin
-      blockCoordinatesZ = blockIndicesZ.astype(float) * self.__dvz * 4 + self.__vzmin
-      # Get cell indices:
-      cellids = np.remainder(vcellids.astype(int), (int)(64))
-      cellIndicesX = np.remainder(cellids.astype(int), (int)(4))
-      cellIndicesY = np.remainder((cellids.astype(int)/(int)(4)).astype(int), (int)(4))
-      cellIndicesZ = cellids.astype(int)/(int)(16)
-      # Get cell coordinates:
-      cellCoordinates = np.array([blockCoordinatesX.astype(float) + (cellIndicesX.astype(float) + 0.5) * self.__dvx,
-                                  blockCoordinatesY.astype(float) + (cellIndicesY.astype(float) + 0.5) * self.__dvy,
-                                  blockCoordinatesZ.astype(float) + (cellIndicesZ.astype(float) + 0.5) * self.__dvz])
-
-      return cellCoordinates.transpose()
+      cellCoordinates = np.empty((len(vcellids), 3))
+      cellCoordinates[:,0] = np.remainder(blocks, (int)(self.__vxblocks)).astype(float) * self.__dvx * 4 + self.__vxmin
+      cellCoordinates[:,1] = np.remainder(blocks // (int)(self.__vxblocks), (int)(self.__vyblocks)).astype(float) * self.__dvy * 4 + self.__vymin
+      cellCoordinates[:,2] = (blocks // (int)(self.__vxblocks*self.__vyblocks)).astype(float) * self.__dvz * 4 + self.__vzmin
+      # Add the cell coordinates within the blocks:
+      cellCoordinates += self.__get_velocity_cell_offset_table()[np.remainder(vcellids, 64)]
+      return cellCoordinates
+
+   def __get_velocity_cell_offset_table(self):
+      ''' Returns the coordinates of the velocity cell centers relative to their block, shared between the readers with the same velocity cell size
+
+          :returns: a numpy array of shape (64,3), indexed by velocity cell id modulo 64
+      '''
+      layout = (self.__dvx, self.__dvy, self.__dvz)
+      if layout not in velocity_cell_offset_tables:
+         cellids = np.arange(64)
+         table = np.empty((64, 3))
+         table[:,0] = (np.remainder(cellids, 4).astype(float) + 0.5) * self.__dvx
+         table[:,1] = (np.remainder(cellids // 4, 4).astype(float) + 0.5) * self.__dvy
+         table[:,2] = ((cellids // 16).astype(float) + 0.5) * self.__dvz
+         table.flags.writeable = False
+         velocity_cell_offset_tables[layout] = table
+      return velocity_cell_offset_tables[layout]
 
    def get_velocity_block_coordinates( self, blocks ):
       ''' Returns the block coordinates of the given blocks in a numpy array
@@ -998,21 +1602,38 @@ class VlsvReader(object):
 
       .. seealso:: :func:`read_blocks`
       '''
-      #these two arrays are in the same order: 
-      #list of cells for which dist function is saved
-      cells_with_blocks = self.read(mesh="SpatialGrid",tag="CELLSWITHBLOCKS")
-      #number of blocks in each cell for which data is stored
-      blocks_per_cell = self.read(mesh="SpatialGrid",tag="BLOCKSPERCELL")
-      (cells_with_blocks_index,) = np.where(cells_with_blocks == cellid)
+      cell_blocks = self.__get_cell_blocks(cellid)
 
-      if len(cells_with_blocks_index) == 0:
+      if cell_blocks is None:
          #block data did not exist
          print "Cell does not have velocity distribution"
          return []
 
-      num_of_blocks = np.atleast_1d(blocks_per_cell)[cells_with_blocks_index[0]]
+      (offset, num_of_blocks) = cell_blocks
+
+      return self.__read_velocity_cells(cellid=cellid, offset=offset, num_of_blocks=num_of_blocks)
+
+   def read_velocity_cells_array(self, cellid):
+      ''' Read velocity cells from a spatial cell into numpy arrays, without building a dictionary like :func:`read_velocity_cells`
+
+      :param cellid: Cell ID of the cell whose velocity cells the function will read
+      :returns: [velocity cell ids, values], both empty if the cell has no velocity distribution
+
+      .. code-block:: python
 
-      return self.__read_velocity_cells(cellid=cellid, cells_with_blocks=cells_with_blocks, blocks_per_cell=blocks_per_cell, cells_with_blocks_index=cells_with_blocks_index)
+         # Example usage:
+         [vcellids, values] = vlsvReader.read_velocity_cells_array(1111)
+         velocity_cell_coordinates = vlsvReader.get_velocity_cell_coordinates(vcellids)
+         # Bulk velocity:
+         print np.sum(velocity_cell_coordinates * values[:,None], axis=0) / np.sum(values)
+
+      .. seealso:: :func:`read_velocity_cells`
+      '''
+      cell_blocks = self.__get_cell_blocks(cellid)
+      if cell_blocks is None:
+         return [np.zeros(0, dtype=np.int64), np.zeros(0)]
+      (offset, num_of_blocks) = cell_blocks
+      return self.__read_velocity_cell_arrays(offset=offset, num_of_blocks=num_of_blocks)
       
    def get_spatial_mesh_size(self):
       ''' Read spatial mesh size
@@ -1064,15 +1685,200 @@ class VlsvReader(object):
 
       .. seealso:: :func:`read_velocity_cells`
       '''
-      if( len(self.__fileindex_for_cellid_blocks) == 0 ):
-         # Set the locations
-         self.__set_cell_offset_and_blocks()
-
       # Uses new format
       return self.__read_blocks(cellid)
 
       return []
 
+   def read_blocks_many(self, cellids):
+      ''' Read the raw block data of several cells at once. The data is returned in a compressed sparse row layout: the block
+      ids and the data of all cells are concatenated and the blocks of the i:th cell are at offsets[i]:offsets[i+1]
+
+      :param cellids: List of cell ids. Cells without velocity blocks get no blocks
+      :returns: [block_ids, data, offsets], where block_ids has the shape (number of blocks,), data (number of blocks, cells per block) and offsets (len(cellids)+1,). If the file has no velocity data, block_ids and data are empty and offsets are zero
+
+      .. code-block:: python
+
+         # Example usage:
+         [block_ids, avgs, offsets] = vlsvReader.read_blocks_many(vlsvReader.read(mesh="SpatialGrid", tag="CELLSWITHBLOCKS"))
+         # Total phase space density of every cell:
+         density = np.add.reduceat(np.sum(avgs, axis=1), offsets[:-1])
+
+      .. seealso:: :func:`read_blocks`
+      '''
+      block_ids_entry = self.__get_footer_entry("", "BLOCKIDS", "SpatialGrid")
+      avgs_entry = self.__get_avgs_footer_entry()
+      if block_ids_entry is None or avgs_entry is None:
+         # No velocity data in the file
+         cells_per_block = self.__vxblock_size * self.__vyblock_size * self.__vzblock_size
+         return [np.zeros(0, dtype=np.uint32), np.zeros((0, cells_per_block)), np.zeros(len(np.atleast_1d(cellids))+1, dtype=np.int64)]
+      if block_ids_entry[1] != np.uint32 and block_ids_entry[1] != np.uint64:
+         print "Error! Bad block id data!"
+         print "Data type: " + str(block_ids_entry[1])
+         return
+
+      (block_offsets, block_counts) = self.__get_cells_blocks(cellids)
+      offsets = np.zeros(len(block_counts)+1, dtype=np.int64)
+      offsets[1:] = np.cumsum(block_counts)
+
+      if self.__fptr.closed and not self.__use_mmap:
+         fptr = open(self.file_name,"rb")
+      else:
+         fptr = self.__fptr
+
+      data_avgs = self.__read_block_ranges(fptr, avgs_entry, block_offsets, block_counts)
+      data_block_ids = self.__read_block_ranges(fptr, block_ids_entry, block_offsets, block_counts)
+      data_block_ids = np.reshape(data_block_ids, (len(data_block_ids),) )
+
+      if self.__fptr.closed:
+         fptr.close()
+
+      return [data_block_ids, data_avgs, offsets]
+
+   def read_velocity_distribution(self, cellid, crop=True):
+      ''' Reconstructs the distribution function of a cell on the regular velocity grid. The last reconstructed distributions are
+      kept in a cache, see :func:`set_velocity_distribution_cache_size`
+
+      :param cellid: Cell ID of the cell whose distribution is read
+      :param crop: If True the grid is cropped to the bounding box of the velocity blocks of the cell, otherwise the grid covers the whole velocity mesh
+      :returns: [f, extent], where f is a read-only array of shape (nvx, nvy, nvz) indexed as f[ivx, ivy, ivz] and extent is [vxmin, vymin, vzmin, vxmax, vymax, vzmax] of the grid, or None if the cell has no velocity distribution
+
+      .. code-block:: python
+
+         # Example usage:
+         [f, extent] = vlsvReader.read_velocity_distribution(1111)
+         # Cuts through the same distribution reuse the cached grid:
+         vx_vy_plane = f[:, :, f.shape[2]/2]
+         vx_vz_plane = vlsvReader.read_velocity_distribution(1111)[0][:, f.shape[1]/2, :]
+
+      .. seealso:: :func:`read_velocity_cells_array`
+      '''
+      key = (cellid, crop)
+      if key in self.__velocity_distributions:
+         # Mark as the most recently used
+         distribution = self.__velocity_distributions.pop(key)
+         self.__velocity_distributions[key] = distribution
+         return distribution
+
+      blocks = self.read_blocks(cellid)
+      if len(blocks) == 0:
+         print "Cell does not have velocity distribution"
+         return None
+      [block_ids, avgs] = blocks
+      block_ids = np.asarray(block_ids).astype(np.int64)
+      # Block indices:
+      block_indices = np.array([np.remainder(block_ids, (int)(self.__vxblocks)),
+                                np.remainder(block_ids // (int)(self.__vxblocks), (int)(self.__vyblocks)),
+                                block_ids // (int)(self.__vxblocks*self.__vyblocks)])
+      if crop:
+         lower = np.min(block_indices, axis=1)
+         upper = np.max(block_indices, axis=1) + 1
+      else:
+         lower = np.zeros(3, dtype=np.int64)
+         upper = np.array([self.__vxblocks, self.__vyblocks, self.__vzblocks], dtype=np.int64)
+      # Scatter the velocity cells of all blocks into the grid at once
+      cells = np.arange(64)
+      cell_indices = [np.remainder(cells, 4), np.remainder(cells // 4, 4), cells // 16]
+      f = np.zeros(tuple((upper - lower) * 4), dtype=avgs.dtype)
+      f[tuple(((block_indices[i] - lower[i]) * 4)[:,None] + cell_indices[i][None,:] for i in xrange(3))] = avgs
+      f.flags.writeable = False
+      vmin = np.array([self.__vxmin, self.__vymin, self.__vzmin])
+      dv = np.array([self.__dvx, self.__dvy, self.__dvz])
+      extent = np.concatenate((vmin + lower * 4 * dv, vmin + upper * 4 * dv))
+
+      distribution = [f, extent]
+      if self.__velocity_distribution_cache_size > 0:
+         self.__velocity_distributions[key] = distribution
+         while len(self.__velocity_distributions) > self.__velocity_distribution_cache_size:
+            self.__velocity_distributions.popitem(last=False)
+      return distribution
+
+   def set_velocity_distribution_cache_size(self, size):
+      ''' Sets the number of reconstructed distributions kept in the cache of :func:`read_velocity_distribution`
+
+      :param size: Number of distributions, 0 disables the cache
+      '''
+      self.__velocity_distribution_cache_size = size
+      while len(self.__velocity_distributions) > size:
+         self.__velocity_distributions.popitem(last=False)
+
+   def read_velocity_moments(self, cellids=-1, origin=[0.0, 0.0, 0.0], radius=None, inner_radius=None, mass=1.672622e-27, chunk_size=16384):
+      ''' Calculates the velocity moments of the distribution functions of the given cells. The block data is read in chunks of
+      cells and the moments of every cell in a chunk are calculated at once
+
+      :param cellids: a value of -1 calculates the moments of all cells in the order of the CellID variable, a list of cell ids calculates the moments of the given cells
+      :param origin: Origin of the velocity space sphere or shell the moments are restricted to
+      :param radius: Only the velocity cells with abs(v - origin) <= radius are included (OPTIONAL)
+      :param inner_radius: Only the velocity cells with abs(v - origin) > inner_radius are included (OPTIONAL)
+      :param mass: Mass of the particles in kg, the proton mass by default
+      :param chunk_size: Approximate number of velocity blocks read at a time
+      :returns: a dictionary with the number density "rho" (N), the bulk velocity "v" (N,3), the pressure tensor "PTensor" (N,3,3) and the heat flux vector "HeatFlux" (N,3). The moments of the cells without a velocity distribution are zero
+
+      .. code-block:: python
+
+         # Example usage:
+         moments = vlsvReader.read_velocity_moments()
+         # Compare with the moments calculated by the simulation:
+         print np.max(np.abs(moments["rho"] - vlsvReader.read_variable("rho")))
+         # Moments of the backstreaming population, outside a sphere around the solar wind velocity:
+         backstream_moments = vlsvReader.read_velocity_moments(origin=[-500e3, 0, 0], inner_radius=468621)
+
+      .. seealso:: :func:`read_blocks_many`
+      '''
+      cellids = get_data(cellids)
+      if len(np.shape(cellids)) == 0 and cellids < 0:
+         cellids = self.read(mesh="SpatialGrid", name="CellID", tag="VARIABLE")
+      cellids = np.atleast_1d(cellids)
+      origin = np.asarray(origin, dtype=float)
+      volume = self.__dvx * self.__dvy * self.__dvz
+      cell_offsets = self.__get_velocity_cell_offset_table()
+
+      rho = np.zeros(len(cellids))
+      v = np.zeros((len(cellids), 3))
+      PTensor = np.zeros((len(cellids), 3, 3))
+      HeatFlux = np.zeros((len(cellids), 3))
+
+      # Split the cells into chunks of about chunk_size blocks
+      (block_offsets, block_counts) = self.__get_cells_blocks(cellids)
+      chunk_of_cell = (np.cumsum(block_counts) - block_counts) // chunk_size
+      chunk_starts = np.concatenate(([0], np.flatnonzero(np.diff(chunk_of_cell)) + 1))
+      chunk_ends = np.concatenate((chunk_starts[1:], [len(cellids)]))
+      for start, end in zip(chunk_starts, chunk_ends):
+         if np.sum(block_counts[start:end]) == 0:
+            continue
+         [block_ids, avgs, offsets] = self.read_blocks_many(cellids[start:end])
+         num_of_cells = end - start
+         # Index of the cell of every block in the chunk:
+         cell_of_block = np.repeat(np.arange(num_of_cells), np.diff(offsets))
+         # Velocity cell coordinates, shape (blocks, 64) for every component:
+         block_coordinates = self.get_velocity_block_coordinates(np.asarray(block_ids))
+         velocities = [block_coordinates[:,i,None] + cell_offsets[None,:,i] for i in xrange(3)]
+         f = avgs.astype(float) * volume
+         if radius is not None or inner_radius is not None:
+            radiuses = sum((velocities[i] - origin[i])**2 for i in xrange(3))
+            if radius is not None:
+               f = f * (radiuses <= radius**2)
+            if inner_radius is not None:
+               f = f * (radiuses > inner_radius**2)
+         cell_sum = lambda values: np.bincount(cell_of_block, weights=np.sum(values, axis=1), minlength=num_of_cells)
+         # Density and bulk velocity:
+         chunk_rho = cell_sum(f)
+         chunk_v = np.zeros((num_of_cells, 3))
+         nonzero = chunk_rho > 0
+         for i in xrange(3):
+            chunk_v[nonzero,i] = cell_sum(f * velocities[i])[nonzero] / chunk_rho[nonzero]
+         rho[start:end] = chunk_rho
+         v[start:end] = chunk_v
+         # Pressure tensor and heat flux in the frame of the bulk velocity:
+         relative_velocities = [velocities[i] - chunk_v[cell_of_block,i,None] for i in xrange(3)]
+         relative_speed2 = sum(relative_velocities[i]**2 for i in xrange(3))
+         for i in xrange(3):
+            for j in xrange(i, 3):
+               PTensor[start:end,i,j] = mass * cell_sum(f * relative_velocities[i] * relative_velocities[j])
+               PTensor[start:end,j,i] = PTensor[start:end,i,j]
+            HeatFlux[start:end,i] = 0.5 * mass * cell_sum(f * relative_speed2 * relative_velocities[i])
+      return {"rho": rho, "v": v, "PTensor": PTensor, "HeatFlux": HeatFlux}
+
    def optimize_open_file(self):
       '''Opens the vlsv file for reading
          Files are opened and closed automatically upon reading and in the case of reading multiple times it will help to keep the file open with this command
@@ -1131,7 +1937,10 @@ class VlsvReader(object):
 
          .. note:: This should only be used for optimization purposes.
       '''
-      self.__fileindex_for_cellid_blocks = {}
+      self.__blocks_cellids = np.zeros(0, dtype=np.int64)
+      self.__blocks_offsets = np.zeros(0, dtype=np.int64)
+      self.__blocks_counts = np.zeros(0, dtype=np.int64)
+      self.__velocity_distributions = OrderedDict()
 
    def optimize_clear_fileindex_for_cellid(self):
       ''' Clears a private variable containing cell ids and their locations
@@ -1152,6 +1961,8 @@ class VlsvReader(object):
 
          .. note:: This should only be used for optimization purposes.
       '''
-      self.__fileindex_for_cellid = {}
+      self.__fileindex_for_cellid = np.zeros(0, dtype=np.int64)
+      self.__sorted_cellids = None
+      self.__grid_fileindices = None
 
 
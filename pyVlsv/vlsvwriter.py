@@ -6,19 +6,74 @@ import os
 from reduction import datareducers,data_operators
 from collections import Iterable
 
+# Size of the chunks of the read/write fallback of byte-level array copies
+copy_chunk_size = 16*1024**2
+
+def copy_file_bytes( source, destination, source_offset, count ):
+   ''' Copies bytes from a file into the current position of another file without decoding them. Uses os.copy_file_range or
+       os.sendfile when available and falls back to chunked reads and writes, so the memory use does not depend on count
+
+       :param source:          File object open for reading
+       :param destination:     File object open for writing, the bytes are written at its current position
+       :param source_offset:   Offset of the first byte in the source file
+       :param count:           Number of bytes to copy
+   '''
+   destination_offset = destination.tell()
+   copied = 0
+   copy_file_range = getattr(os, "copy_file_range", None)
+   sendfile = getattr(os, "sendfile", None)
+   if copy_file_range is not None or sendfile is not None:
+      destination.flush()
+      try:
+         while copied < count:
+            if copy_file_range is not None:
+               n = copy_file_range(source.fileno(), destination.fileno(), count - copied, source_offset + copied, destination_offset + copied)
+            else:
+               os.lseek(destination.fileno(), destination_offset + copied, os.SEEK_SET)
+               n = sendfile(destination.fileno(), source.fileno(), source_offset + copied, count - copied)
+            if n <= 0:
+               break
+            copied = copied + n
+      except OSError:
+         # E.g. not supported by the file system, copy the rest with the fallback
+         pass
+      destination.seek(destination_offset + copied)
+   source.seek(source_offset + copied)
+   while copied < count:
+      chunk = source.read(min(copy_chunk_size, count - copied))
+      if len(chunk) == 0:
+         raise IOError("Unexpected end of file in " + source.name)
+      destination.write(chunk)
+      copied = copied + len(chunk)
+
 
 class VlsvWriter(object):
    ''' Class for reading VLSV files
    '''
    file_name = ""
-   def __init__(self, vlsvReader, file_name ):
+   def __init__(self, vlsvReader, file_name, deferred_footer=False, buffer_size=16*1024**2, copy_cellids=True ):
       ''' Initializes the vlsv file (opens the file, reads the file footer and reads in some parameters)
 
           :param vlsvReader:    Some open vlsv file for creating an XML footer as well as the grid
           :param file_name:     Name of the vlsv file where to input data
+          :param deferred_footer: If True the arrays are written through a buffer of buffer_size bytes and the xml footer is written only once, in :func:`close`. Otherwise the footer is rewritten after every array, so that the file is valid at all times
+          :param buffer_size:   Size of the write buffer in bytes when deferred_footer is True
+          :param copy_cellids:  If False the cell ids of the spatial mesh (MESH and MESH_DOMAIN_SIZES) are not copied from vlsvReader, only the parameters and the mesh geometry, so that a subset of the cells can be written, see :func:`extract_region`
+
+          .. code-block:: python
+
+             # Example usage:
+             # The footer is written when the with block ends, also if an exception is raised in it
+             with VlsvWriter(vlsvReader, "output.vlsv", deferred_footer=True) as vlsvWriter:
+                vlsvWriter.copy_variables(vlsvReader)
+                vlsvWriter.write(data=rho_filtered, name="rho_filtered", tag="VARIABLE", mesh="SpatialGrid")
       '''
       self.file_name = os.path.abspath(file_name)
-      self.__fptr = open(self.file_name,"wb")
+      self.__deferred_footer = deferred_footer
+      if deferred_footer:
+         self.__fptr = open(self.file_name,"wb",buffer_size)
+      else:
+         self.__fptr = open(self.file_name,"wb")
 
       self.__xml_root = ET.fromstring("<VLSV></VLSV>")
       self.__fileindex_for_cellid={}
@@ -29,13 +84,13 @@ class VlsvWriter(object):
       # Write xml_offset, for now put this to zero:
       np.array(0, dtype=np.uint64).tofile(self.__fptr)
 
-      self.__initialize( vlsvReader )
+      self.__initialize( vlsvReader, copy_cellids )
 
-   def __initialize( self, vlsvReader ):
+   def __initialize( self, vlsvReader, copy_cellids=True ):
       ''' Writes the xml footer as well as the cell ids from the vlsvReader to the file and everything else needed for the grid
       '''
       # Get the xml sheet:
-      xml_root = vlsvReader._VlsvReader__xml_root
+      xml_root = vlsvReader.get_xml_root()
 
       # Get list of tags to write:
       tags = {}
@@ -44,27 +99,21 @@ class VlsvWriter(object):
       tags['MESH_NODE_CRDS_X'] = ''
       tags['MESH_NODE_CRDS_Y'] = ''
       tags['MESH_NODE_CRDS_Z'] = ''
-      tags['MESH'] = ''
-      tags['MESH_DOMAIN_SIZES'] = ''
-      tags['CellID'] = ''
       tags['MESH_BBOX'] = ''
       tags['COORDS'] = ''
+      if copy_cellids:
+         tags['MESH'] = ''
+         tags['MESH_DOMAIN_SIZES'] = ''
+         tags['CellID'] = ''
 
       # Copy the xml root
-      for child in xml_root:
-         if child.tag in tags:
-            if 'name' in child.attrib: name = child.attrib['name']
-            else: name = ''
-            if 'mesh' in child.attrib: mesh = child.attrib['mesh']
-            else: mesh = ''
-            tag = child.tag
-            extra_attribs = {}
-            for i in child.attrib.iteritems():
-               if i[0] != 'name' and i[0] != 'mesh':
-                  extra_attribs[i[0]] = i[1]
-            data = vlsvReader.read( name=name, tag=tag, mesh=mesh )
-            # Write the data:
-            self.write( data=data, name=name, tag=tag, mesh=mesh, extra_attribs=extra_attribs )
+      source = open(vlsvReader.file_name, "rb")
+      try:
+         for child in xml_root:
+            if child.tag in tags:
+               self.__copy_array( vlsvReader, source, child )
+      finally:
+         source.close()
 
 
    def copy_variables( self, vlsvReader ):
@@ -72,34 +121,48 @@ class VlsvWriter(object):
 
       '''
       # Get the xml sheet:
-      xml_root = vlsvReader._VlsvReader__xml_root
+      xml_root = vlsvReader.get_xml_root()
 
       # Get list of tags to write:
       tags = {}
       tags['VARIABLE'] = ''
 
       # Copy the xml root and write variables
-      for child in xml_root:
-         if child.tag in tags:
-            if 'name' in child.attrib:
-                name = child.attrib['name']
-            else:
-                name = ''
-            if 'mesh' in child.attrib:
-                mesh = child.attrib['mesh']
-            else:
-                mesh = ''
-            tag = child.tag
-            # Copy extra attributes:
-            extra_attribs = {}
-            for i in child.attrib.iteritems():
-               if i[0] != 'name' and i[0] != 'mesh':
-                  extra_attribs[i[0]] = i[1]
-            data = vlsvReader.read( name=name, tag=tag, mesh=mesh )
-            # Write the data:
-            self.write( data=data, name=name, tag=tag, mesh=mesh, extra_attribs=extra_attribs )
+      source = open(vlsvReader.file_name, "rb")
+      try:
+         for child in xml_root:
+            if child.tag in tags:
+               self.__copy_array( vlsvReader, source, child )
+      finally:
+         source.close()
       return
 
+   def __copy_array( self, vlsvReader, source, source_child ):
+      ''' Copies an array byte by byte from another vlsv file, only the xml footer entry is rewritten
+
+          :param vlsvReader:   Reader of the other vlsv file
+          :param source:       The other vlsv file, open for reading
+          :param source_child: The xml element of the array in the other file
+      '''
+      fptr = self.__fptr
+      child = ET.SubElement(parent=self.__xml_root, tag=source_child.tag)
+      for i in source_child.attrib.iteritems():
+         child.attrib[i[0]] = str(i[1])
+      count = int(child.attrib["arraysize"]) * int(child.attrib["vectorsize"]) * int(child.attrib["datasize"])
+      # Info the xml about the file offset for the data:
+      child.text = str(fptr.tell())
+      if vlsvReader.is_compressed():
+         # The data has to be decompressed, copy it in pieces
+         for start in xrange(0, count, copy_chunk_size):
+            data = vlsvReader.read_array_bytes( source, int(source_child.text) + start, min(copy_chunk_size, count - start) )
+            fptr.write(data.tostring())
+      else:
+         copy_file_bytes( source, fptr, int(source_child.text), count )
+
+      # write the xml footer:
+      if not self.__deferred_footer:
+         self.__write_xml_footer()
+
    def write_velocity_space( self, vlsvReader, cellid, blocks_and_values ):
       ''' Writes given velocity space into vlsv file
 
@@ -182,7 +245,8 @@ class VlsvWriter(object):
       data.tofile(fptr)
 
       # write the xml footer:
-      self.__write_xml_footer()
+      if not self.__deferred_footer:
+         self.__write_xml_footer()
 
    def __write_xml_footer( self ):
       # Write the xml footer:
@@ -208,6 +272,17 @@ class VlsvWriter(object):
       fptr.seek(current_offset)
 
    def close( self ):
+      ''' Writes the xml footer and closes the file
+      '''
+      if self.__fptr.closed:
+         return
       self.__write_xml_footer()
       self.__fptr.close()
 
+   def __enter__( self ):
+      return self
+
+   def __exit__( self, exc_type, exc_value, traceback ):
+      self.close()
+      return False
+
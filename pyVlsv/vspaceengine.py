@@ -0,0 +1,102 @@
+''' Evaluation of the datareducers that use velocity space data (useVspace) in a pool of processes
+
+    The cells with a velocity distribution are split into chunks which are evaluated by worker processes, each of which keeps
+    one reader of the file open. The results are written into a preallocated output array as the chunks finish.
+
+    .. code-block:: python
+
+       # Example usage:
+       import pytools as pt
+       vlsvReader = pt.vlsvfile.VlsvReader("fullf.0001.vlsv")
+       def progress( done, total ):
+          print done, "/", total
+       gyrophase_relstddev = vlsvReader.read_vspace_variable("gyrophase_relstddev", processes=8, progress=progress)
+'''
+
+import numpy as np
+import multiprocessing
+from reduction import datareducers
+
+# The reader of a worker process, opened by the pool initializer
+_worker_reader = None
+
+def _initialize_worker( file_name ):
+   ''' Opens the reader of a worker process
+   '''
+   global _worker_reader
+   from vlsvreader import VlsvReader
+   _worker_reader = VlsvReader(file_name)
+   _worker_reader.optimize_open_file()
+
+def _evaluate_worker_chunk( task ):
+   ''' Evaluates a chunk of cells in a worker process
+   '''
+   (name, tag, mesh, indices, cellids) = task
+   return (indices, evaluate_vspace_cells(_worker_reader, name, tag, mesh, cellids))
+
+def evaluate_vspace_cells( vlsvReader, name, tag, mesh, cellids ):
+   ''' Evaluates a velocity space datareducer in the given cells. The datareducer operation is called with the input variables of a
+       cell, the values of its velocity cells and the coordinates of its velocity cells (see :func:`VlsvReader.read_velocity_cells_array`)
+
+       :param vlsvReader:      Some VlsvReader class with a file open
+       :param name:            Name of the datareducer
+       :param tag:             Tag of the input variables of the datareducer
+       :param mesh:            Mesh of the input variables of the datareducer
+       :param cellids:         List of cell ids
+       :returns: array of the datareducer values, NaN for the cells without a velocity distribution
+   '''
+   reducer = datareducers[name]
+   cellids = np.asarray(cellids)
+   # Read the input variables of all cells at once:
+   tmp_vars = [vlsvReader.read(i, tag, mesh, "pass", cellids) for i in np.atleast_1d(reducer.variables)]
+   output = np.empty(len(cellids))
+   output[:] = np.nan
+   for index in xrange(len(cellids)):
+      [vcellids, velocity_cell_values] = vlsvReader.read_velocity_cells_array(cellids[index])
+      if len(vcellids) == 0:
+         continue
+      # Get coordinates:
+      velocity_coordinates = vlsvReader.get_velocity_cell_coordinates(vcellids)
+      output[index] = reducer.operation( [variable[index] for variable in tmp_vars], velocity_cell_values, velocity_coordinates )
+   return output
+
+def evaluate_vspace_reducer( vlsvReader, name, tag, mesh, cellids, processes=None, chunk_size=16, progress=None ):
+   ''' Evaluates a velocity space datareducer in the given cells with a pool of processes
+
+       :param vlsvReader:      Some VlsvReader class with a file open
+       :param name:            Name of the datareducer
+       :param tag:             Tag of the input variables of the datareducer
+       :param mesh:            Mesh of the input variables of the datareducer
+       :param cellids:         List of cell ids
+       :param processes:       Number of worker processes, None for one per cpu. With 1 the cells are evaluated in this process using vlsvReader
+       :param chunk_size:      Number of cells given to a worker at a time
+       :param progress:        Function called as progress(done, total) whenever a chunk of cells is finished (OPTIONAL)
+       :returns: array of the datareducer values, NaN for the cells without a velocity distribution
+   '''
+   cellids = np.atleast_1d(cellids)
+   output = np.empty(len(cellids))
+   output[:] = np.nan
+   # Only the cells with a velocity distribution are evaluated
+   cellswithblocks = np.atleast_1d(vlsvReader.read(mesh="SpatialGrid", tag="CELLSWITHBLOCKS"))
+   indices = np.flatnonzero(np.in1d(cellids, cellswithblocks))
+   tasks = [(name, tag, mesh, indices[i:i+chunk_size], cellids[indices[i:i+chunk_size]]) for i in xrange(0, len(indices), chunk_size)]
+   done = 0
+   if processes == 1:
+      for task in tasks:
+         output[task[3]] = evaluate_vspace_cells(vlsvReader, name, tag, mesh, task[4])
+         done = done + len(task[3])
+         if progress is not None:
+            progress(done, len(indices))
+      return output
+   pool = multiprocessing.Pool(processes, _initialize_worker, (vlsvReader.file_name,))
+   try:
+      for (chunk_indices, values) in pool.imap_unordered(_evaluate_worker_chunk, tasks):
+         output[chunk_indices] = values
+         done = done + len(chunk_indices)
+         if progress is not None:
+            progress(done, len(indices))
+      pool.close()
+   finally:
+      pool.terminate()
+      pool.join()
+   return output
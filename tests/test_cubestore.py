@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from vlsvtestfile import write_vlsv_file
+import pytools as pt
+
+class TestCubeStore(unittest.TestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.file_names = []
+      for i in xrange(4):
+         file_name = os.path.join(self.directory, "bulk.%07d.vlsv" % i)
+         write_vlsv_file(file_name, t=0.5*i, tstep=10*i)
+         self.file_names.append(file_name)
+      self.path = os.path.join(self.directory, "probes.cube")
+
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+
+   def test_create_and_append(self):
+      # The files of a batch are ordered by time
+      store = pt.vlsvfile.create_cube_store(self.path, self.file_names[2::-1], ["rho", "B"], cellids=[4, 2], processes=1)
+      [t, tstep] = store.get_times()
+      self.assertTrue(np.array_equal(t, [0.0, 0.5, 1.0]))
+      self.assertTrue(np.array_equal(tstep, [0, 10, 20]))
+      self.assertEqual(store.read("B").shape, (3, 2, 3))
+      self.assertTrue(np.array_equal(store.read("rho")[:,0], [4, 4, 4]))
+      store = pt.vlsvfile.CubeStore(self.path)
+      store.append(self.file_names, processes=1)
+      self.assertEqual(len(store.get_file_names()), 4)
+      self.assertEqual(store.read("B").shape, (4, 2, 3))
+      self.assertTrue(np.array_equal(store.read("B")[3,1], [2.0, 4.0, 6.0]))
+
+   def test_create_replaces_an_old_store(self):
+      pt.vlsvfile.create_cube_store(self.path, self.file_names, ["rho", "B"], cellids=[4, 2], processes=1)
+      store = pt.vlsvfile.create_cube_store(self.path, self.file_names[:1], ["B"], cellids=[4, 2], processes=1)
+      self.assertEqual(store.read("B").shape, (1, 2, 3))
+      self.assertEqual(len(store.get_times()[0]), 1)
+      self.assertFalse(os.path.isfile(os.path.join(self.path, "rho.npy")))
+
+if __name__ == "__main__":
+   unittest.main()
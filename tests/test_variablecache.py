@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from vlsvtestfile import write_vlsv_file
+import pytools as pt
+
+class TestVariableCache(unittest.TestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.file_name = os.path.join(self.directory, "test.vlsv")
+      write_vlsv_file(self.file_name)
+
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+
+   def test_reader_hits_the_cache(self):
+      cache = pt.vlsvfile.VariableCache(max_bytes=1024**2)
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name, variable_cache=cache)
+      first = vlsvReader.read_variable("B", [3, 1])
+      hits = cache.get_statistics()["hits"]
+      second = vlsvReader.read_variable("B", [3, 1])
+      self.assertTrue(np.array_equal(first, second))
+      self.assertTrue(cache.get_statistics()["hits"] > hits)
+      self.assertFalse(second.flags.writeable)
+
+   def test_eviction(self):
+      cache = pt.vlsvfile.VariableCache(max_bytes=2*800)
+      cache.put("a", np.zeros(100))
+      cache.put("b", np.zeros(100))
+      cache.get("a")
+      cache.put("c", np.zeros(100))
+      # b was the least recently used
+      self.assertEqual(cache.get("b"), None)
+      self.assertTrue(cache.get("a") is not None and cache.get("c") is not None)
+      self.assertEqual(cache.get_statistics()["evictions"], 1)
+      self.assertEqual(cache.nbytes, 2*800)
+
+   def test_values_larger_than_the_cache(self):
+      cache = pt.vlsvfile.VariableCache(max_bytes=100)
+      value = cache.put("a", np.zeros(100))
+      self.assertTrue(value.flags.writeable)
+      self.assertEqual(cache.get("a"), None)
+      self.assertEqual(len(cache), 0)
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from vlsvtestfile import write_vlsv_file
+import pytools as pt
+
+class TestQueryCellsWithDistribution(unittest.TestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.file_name = os.path.join(self.directory, "test.vlsv")
+      # Cells 1 and 12 have a velocity distribution
+      write_vlsv_file(self.file_name, velocity_space=True)
+
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+
+   def test_nearest_cells(self):
+      vlasiatorReader = pt.vlsvfile.VlasiatorReader(self.file_name)
+      [cellids, distances] = vlasiatorReader.query_cells_with_distribution(np.array([[0.0, 0.0, 0.5], [4.0, 3.0, 0.5], [1.6, 0.5, 0.5]]))
+      self.assertTrue(np.array_equal(cellids, [1, 12, 1]))
+      self.assertTrue(np.allclose(distances, [np.sqrt(0.5), np.sqrt(0.5), 1.1]))
+      [cellid, distance] = vlasiatorReader.query_cells_with_distribution([3.0, 2.0, 0.5])
+      self.assertEqual(cellid, 12)
+      [cellids, distances] = vlasiatorReader.query_cells_with_distribution(np.array([[3.0, 2.0, 0.5]]), k=5)
+      self.assertTrue(np.array_equal(cellids, [[12, 1]]))
+      self.assertTrue(np.array_equal(vlasiatorReader.get_nearest_cellid_with_distribution([2, 11]), [1, 12]))
+      self.assertTrue(np.allclose(vlasiatorReader.get_nearest_coordinates_with_distribution([0.2, 0.2, 0.2]), [0.5, 0.5, 0.5]))
+
+   def test_ties_resolve_to_the_first_cell_in_the_file(self):
+      vlasiatorReader = pt.vlsvfile.VlasiatorReader(self.file_name)
+      # The center of the grid is equally far from cells 1 and 12, cell 1 is first in CELLSWITHBLOCKS
+      self.assertEqual(vlasiatorReader.query_cells_with_distribution([2.0, 1.5, 0.5])[0], 1)
+
+if __name__ == "__main__":
+   unittest.main()
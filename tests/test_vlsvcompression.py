@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from vlsvtestfile import write_vlsv_file
+import pytools as pt
+
+class TestCompression(unittest.TestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.file_name = os.path.join(self.directory, "test.vlsv")
+      write_vlsv_file(self.file_name, velocity_space=True)
+
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+
+   def test_round_trip(self):
+      compressed_file_name = pt.vlsvfile.compress_file(self.file_name, chunk_size=256)
+      self.assertEqual(compressed_file_name, os.path.join(self.directory, "test.vlsvz"))
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      compressedReader = pt.vlsvfile.VlsvReader(compressed_file_name)
+      self.assertTrue(compressedReader.is_compressed())
+      self.assertFalse(vlsvReader.is_compressed())
+      self.assertTrue(np.array_equal(compressedReader.read_variable("B", [7, 2]), vlsvReader.read_variable("B", [7, 2])))
+      self.assertTrue(np.array_equal(compressedReader.read_blocks(12)[1], vlsvReader.read_blocks(12)[1]))
+      decompressed_file_name = os.path.join(self.directory, "decompressed.vlsv")
+      pt.vlsvfile.decompress_file(compressed_file_name, decompressed_file_name)
+      self.assertEqual(open(decompressed_file_name, "rb").read(), open(self.file_name, "rb").read())
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from vlsvtestfile import write_vlsv_file
+import pytools as pt
+
+class TestExtractRegion(unittest.TestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.file_name = os.path.join(self.directory, "test.vlsv")
+      write_vlsv_file(self.file_name, velocity_space=True)
+
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+
+   def test_extract_cells(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      region_file_name = os.path.join(self.directory, "region.vlsv")
+      cellids = pt.vlsvfile.extract_region(vlsvReader, region_file_name, ["rho"], cellids=[7, 1, 3], velocity_space=True)
+      self.assertTrue(np.array_equal(cellids, [1, 3, 7]))
+      region = pt.vlsvfile.VlsvReader(region_file_name)
+      self.assertEqual(sorted(region.read_variable("CellID")), [1, 3, 7])
+      self.assertTrue(np.array_equal(region.read_variable("rho", [7, 1, 3]), [7, 1, 3]))
+      self.assertFalse(region.check_variable("B"))
+      self.assertTrue(np.array_equal(region.read_blocks(1)[1], vlsvReader.read_blocks(1)[1]))
+      self.assertTrue(np.array_equal(region.get_cell_coordinates(7), vlsvReader.get_cell_coordinates(7)))
+
+   def test_extract_box(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      region_file_name = os.path.join(self.directory, "box.vlsv")
+      cellids = pt.vlsvfile.extract_region(vlsvReader, region_file_name, ["rho", "B"], bounding_box=[0, 0, 0, 2, 1, 1])
+      self.assertTrue(np.array_equal(cellids, [1, 2]))
+      region = pt.vlsvfile.VlsvReader(region_file_name)
+      self.assertTrue(np.array_equal(region.read_variable("B", [2]), [[2.0, 4.0, 6.0]]))
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from vlsvtestfile import write_vlsv_file
+import pytools as pt
+
+class VlsvFileTestCase(unittest.TestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.file_name = os.path.join(self.directory, "test.vlsv")
+      write_vlsv_file(self.file_name, velocity_space=True)
+
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+
+class TestReadVariable(VlsvFileTestCase):
+   def test_gather_in_given_order(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      cellids = [5, 2, 12, 5, 1]
+      self.assertTrue(np.array_equal(vlsvReader.read_variable("rho", cellids), cellids))
+      self.assertTrue(np.array_equal(vlsvReader.read_variable("B", cellids, operator="y"), 2.0 * np.array(cellids)))
+      B = vlsvReader.read_variable("B", cellids)
+      for i in xrange(len(cellids)):
+         self.assertTrue(np.array_equal(B[i], vlsvReader.read_variable("B", cellids[i])))
+
+class TestReadInterpolatedVariable(VlsvFileTestCase):
+   def test_batch_matches_single_points(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      points = np.array([[0.7, 0.9, 0.5], [2.25, 1.5, 0.5], [3.1, 2.2, 0.5], [10.0, 0.5, 0.5]])
+      rho = vlsvReader.read_interpolated_variable("rho", points)
+      self.assertEqual(rho.shape, (len(points),))
+      for i in xrange(3):
+         self.assertEqual(rho[i], vlsvReader.read_interpolated_variable("rho", points[i]))
+         # rho is linear in the cell indices
+         self.assertAlmostEqual(rho[i], (points[i][0] - 0.5) + (points[i][1] - 0.5) * 4 + 1)
+      self.assertTrue(np.isnan(rho[3]))
+      self.assertEqual(vlsvReader.read_interpolated_variable("B", points[:3]).shape, (3, 3))
+
+class TestReadVariableGrid(VlsvFileTestCase):
+   def test_grid_order(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      rho = vlsvReader.read_variable_grid("rho")
+      self.assertEqual(rho.shape, (3, 4))
+      self.assertTrue(np.array_equal(rho, np.arange(1, 13).reshape(3, 4)))
+      B = vlsvReader.read_variable_grid("B", out=np.zeros((3, 4, 3)))
+      self.assertTrue(np.array_equal(B[2,1], [10.0, 20.0, 30.0]))
+      self.assertRaises(ValueError, vlsvReader.read_variable_grid, "B", out=np.zeros((4, 3, 3)))
+
+class TestIndexFile(VlsvFileTestCase):
+   def test_index_file_is_written_and_rebuilt(self):
+      index_file_name = self.file_name + ".idx"
+      expected = pt.vlsvfile.VlsvReader(self.file_name).read_variable("rho", [3, 1])
+      pt.vlsvfile.VlsvReader(self.file_name, use_index_file=True)
+      self.assertTrue(os.path.isfile(index_file_name))
+      size = os.path.getsize(index_file_name)
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name, use_index_file=True)
+      self.assertTrue(np.array_equal(vlsvReader.read_variable("rho", [3, 1]), expected))
+      self.assertEqual(len(vlsvReader.read_blocks(1)[0]), 1)
+      # A truncated index file is written again
+      fptr = open(index_file_name, "r+b")
+      fptr.truncate(size // 2)
+      fptr.close()
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name, use_index_file=True)
+      self.assertTrue(np.array_equal(vlsvReader.read_variable("rho", [3, 1]), expected))
+      self.assertEqual(os.path.getsize(index_file_name), size)
+
+class TestVelocitySpace(VlsvFileTestCase):
+   def test_read_velocity_distribution(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      [f, extent] = vlsvReader.read_velocity_distribution(1)
+      self.assertTrue(np.array_equal(f, np.ones((4, 4, 4))))
+      self.assertTrue(np.allclose(extent, [-4, -4, -4, 0, 0, 0]))
+      [f, extent] = vlsvReader.read_velocity_distribution(12, crop=False)
+      self.assertEqual(f.shape, (8, 8, 8))
+      self.assertTrue(np.array_equal(f[4:,4:,4:], 2 * np.ones((4, 4, 4))))
+      self.assertEqual(np.sum(f), 2 * 64)
+      self.assertTrue(np.allclose(extent, [-4, -4, -4, 4, 4, 4]))
+      self.assertEqual(vlsvReader.read_velocity_distribution(5), None)
+
+   def test_read_velocity_moments(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      moments = vlsvReader.read_velocity_moments([1, 5, 12], mass=1.0)
+      self.assertTrue(np.allclose(moments["rho"], [64, 0, 128]))
+      self.assertTrue(np.allclose(moments["v"], [[-2, -2, -2], [0, 0, 0], [2, 2, 2]]))
+      # Uniform cubes of 4 velocity cells a side have the variance 1.25 along every axis
+      self.assertTrue(np.allclose(moments["PTensor"][0], 64 * 1.25 * np.identity(3)))
+      self.assertTrue(np.allclose(moments["PTensor"][2], 128 * 1.25 * np.identity(3)))
+      self.assertTrue(np.allclose(moments["HeatFlux"], 0))
+
+   def test_read_blocks_many(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      [block_ids, data, offsets] = vlsvReader.read_blocks_many([12, 5, 1])
+      self.assertTrue(np.array_equal(block_ids, [7, 0]))
+      self.assertTrue(np.array_equal(offsets, [0, 1, 1, 2]))
+      self.assertTrue(np.array_equal(data[:,0], [2, 1]))
+
+class TestReadBlocksMany(unittest.TestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.file_name = os.path.join(self.directory, "novelocity.vlsv")
+      write_vlsv_file(self.file_name)
+
+   def tearDown(self):
+      shutil.rmtree(self.directory)
+
+   def test_file_without_velocity_data(self):
+      vlsvReader = pt.vlsvfile.VlsvReader(self.file_name)
+      [block_ids, data, offsets] = vlsvReader.read_blocks_many([1, 2, 3])
+      self.assertEqual(len(block_ids), 0)
+      self.assertEqual(len(data), 0)
+      self.assertTrue(np.array_equal(offsets, np.zeros(4)))
+      self.assertEqual(vlsvReader.read_blocks(1), [])
+
+if __name__ == "__main__":
+   unittest.main()
@@ -0,0 +1,57 @@
+''' Writer of the small vlsv files used by the tests
+'''
+
+import os
+import sys
+import numpy as np
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def write_vlsv_file( file_name, nx=4, ny=3, nz=1, t=0.0, tstep=0, velocity_space=False ):
+   ''' Writes a small vlsv file with a spatial grid of nx*ny*nz unit cells starting from the origin
+
+       The cells are written in the reverse order of their cell ids. The variables are rho = cell id and
+       B = cell id * [1, 2, 3]. With velocity_space the velocity mesh has 2x2x2 blocks of 4x4x4 cells between -4 and 4 in every
+       direction, the first cell has the value 1 in every velocity cell of block 0 and the last cell the value 2 in block 7.
+   '''
+   number_of_cells = nx*ny*nz
+   cellids = np.arange(number_of_cells, 0, -1).astype(np.uint64)
+   xml_root = ET.Element("VLSV")
+   fptr = open(file_name, "wb")
+   np.zeros(2, dtype=np.uint64).tofile(fptr)
+   def add_array( tag, data, **attributes ):
+      data = np.atleast_1d(data)
+      child = ET.SubElement(xml_root, tag)
+      for (key, value) in attributes.items():
+         child.attrib[key] = str(value)
+      child.attrib["arraysize"] = str(data.shape[0])
+      child.attrib["vectorsize"] = str(data.shape[1] if data.ndim > 1 else 1)
+      child.attrib["datatype"] = {"f": "float", "i": "int", "u": "uint"}[data.dtype.kind]
+      child.attrib["datasize"] = str(data.dtype.itemsize)
+      child.text = str(fptr.tell())
+      data.tofile(fptr)
+   add_array("PARAMETER", np.array([t]), name="time")
+   add_array("PARAMETER", np.array([tstep], dtype=np.uint32), name="tstep")
+   add_array("MESH_BBOX", np.array([nx, ny, nz, 1, 1, 1], dtype=np.uint64), mesh="SpatialGrid")
+   add_array("MESH_NODE_CRDS_X", np.linspace(0, nx, nx+1), mesh="SpatialGrid")
+   add_array("MESH_NODE_CRDS_Y", np.linspace(0, ny, ny+1), mesh="SpatialGrid")
+   add_array("MESH_NODE_CRDS_Z", np.linspace(0, nz, nz+1), mesh="SpatialGrid")
+   add_array("MESH", cellids, name="SpatialGrid", type="amr_ucd")
+   add_array("MESH_DOMAIN_SIZES", np.array([[len(cellids), 0]], dtype=np.uint64), mesh="SpatialGrid")
+   add_array("VARIABLE", cellids, name="CellID", mesh="SpatialGrid")
+   add_array("VARIABLE", cellids.astype(float), name="rho", mesh="SpatialGrid")
+   add_array("VARIABLE", cellids[:,None] * np.array([1.0, 2.0, 3.0]), name="B", mesh="SpatialGrid")
+   if velocity_space:
+      add_array("MESH_BBOX", np.array([2, 2, 2, 4, 4, 4], dtype=np.uint64), mesh="avgs")
+      for direction in ["X", "Y", "Z"]:
+         add_array("MESH_NODE_CRDS_" + direction, np.linspace(-4.0, 4.0, 3), mesh="avgs")
+      add_array("CELLSWITHBLOCKS", np.array([1, number_of_cells], dtype=np.uint64), mesh="SpatialGrid")
+      add_array("BLOCKSPERCELL", np.array([1, 1], dtype=np.uint32), mesh="SpatialGrid")
+      add_array("BLOCKIDS", np.array([0, 7], dtype=np.uint32), mesh="SpatialGrid")
+      add_array("BLOCKVARIABLE", np.array([[1.0]*64, [2.0]*64], dtype=np.float32), name="avgs", mesh="SpatialGrid")
+   footer_offset = fptr.tell()
+   fptr.write(ET.tostring(xml_root))
+   fptr.seek(8)
+   np.array(footer_offset, dtype=np.uint64).tofile(fptr)
+   fptr.close()
@@ -0,0 +1,28 @@
+#!/usr/bin/python
+import pytools as pt
+import sys
+import os
+import argparse
+
+
+parser = argparse.ArgumentParser(description="Writes compressed companions (.vlsvz) of vlsv files, or decompresses them back into vlsv files")
+parser.add_argument('-i', nargs='*', help="a list of vlsv files (or .vlsvz files with -d)")
+parser.add_argument('-method', default="zlib", help="compression method, zlib or lzma")
+parser.add_argument('-level', type=int, default=6, help="compression level 0-9")
+parser.add_argument('-chunk', type=int, default=1024**2, help="size of the compressed chunks in bytes")
+parser.add_argument('-d', action='store_true', help="decompress .vlsvz files into .vlsv files")
+args = parser.parse_args()
+
+if args.i is None or len(args.i) == 0:
+    print("No input files given")
+    sys.exit(1)
+
+for file_name in args.i:
+    if args.d:
+        output = os.path.splitext(file_name)[0] + ".vlsv"
+        pt.vlsvfile.decompress_file(file_name, output)
+    else:
+        output = pt.vlsvfile.compress_file(file_name, method=args.method, level=args.level, chunk_size=args.chunk)
+        if output is None:
+            sys.exit(1)
+    print(file_name + " -> " + output + " (" + str(os.path.getsize(output)) + " bytes, was " + str(os.path.getsize(file_name)) + " bytes)")
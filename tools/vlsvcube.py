@@ -0,0 +1,42 @@
+#!/usr/bin/python
+import pytools as pt
+import numpy as np
+import sys
+import argparse
+
+
+parser = argparse.ArgumentParser(description="Extracts variables of a set of cells from a series of vlsv files into a cube store, or appends new files to an existing cube store")
+parser.add_argument('-o', required=True, help="the cube store directory")
+parser.add_argument('-i', nargs='*', help="a list of vlsv files")
+parser.add_argument('-var', nargs='*', help="a list of variables to extract, e.g. rho B (not needed when appending)")
+parser.add_argument('-c', help="A file with the cell ids (can also be given from stdin)")
+parser.add_argument('-box', nargs=6, type=float, help="extract the cells inside xmin ymin zmin xmax ymax zmax (in meters) instead of the given cell ids")
+parser.add_argument('-np', type=int, default=None, help="number of processes reading the files, one per cpu by default")
+parser.add_argument('-append', action='store_true', help="append the files to an existing cube store")
+args = parser.parse_args()
+
+if args.i is None or len(args.i) == 0:
+    print("No input files given")
+    sys.exit(1)
+
+if args.append:
+    store = pt.vlsvfile.CubeStore(args.o)
+    store.append(args.i, processes=args.np)
+else:
+    if args.var is None:
+        #defaults
+        variables=["rho","B"]
+    else:
+        variables=args.var
+    if args.box is not None:
+        store = pt.vlsvfile.create_cube_store(args.o, args.i, variables, bounding_box=args.box, processes=args.np)
+    else:
+        #read in cell ids
+        if args.c is None:
+            cellids = np.loadtxt(sys.stdin, dtype=np.int64)
+        else:
+            cellids = np.loadtxt(args.c, dtype=np.int64)
+        store = pt.vlsvfile.create_cube_store(args.o, args.i, variables, cellids=np.atleast_1d(cellids), processes=args.np)
+
+t = store.get_times()[0]
+print("# " + args.o + ": " + str(len(t)) + " files, " + str(len(store.get_cellids())) + " cells, variables " + " ".join(store.get_variables()))
@@ -0,0 +1,31 @@
+#!/usr/bin/python
+import pytools as pt
+import numpy as np
+import sys
+import argparse
+
+
+parser = argparse.ArgumentParser(description="Writes a subset of the variables in a region of a vlsv file into a new vlsv file")
+parser.add_argument('-i', required=True, help="the input vlsv file")
+parser.add_argument('-o', required=True, help="the output vlsv file")
+parser.add_argument('-var', nargs='*', help="a list of variables to extract, e.g. rho B (all stored variables by default)")
+parser.add_argument('-c', help="A file with the cell ids (can also be given from stdin)")
+parser.add_argument('-box', nargs=6, type=float, help="extract the cells inside xmin ymin zmin xmax ymax zmax (in meters) instead of the given cell ids")
+parser.add_argument('-vspace', action='store_true', help="extract also the velocity blocks of the cells")
+args = parser.parse_args()
+
+f = pt.vlsvfile.VlsvReader(args.i)
+
+if args.box is not None:
+    cellids = pt.vlsvfile.extract_region(f, args.o, args.var, bounding_box=args.box, velocity_space=args.vspace)
+else:
+    #read in cell ids
+    if args.c is None:
+        cellids = np.loadtxt(sys.stdin, dtype=np.int64)
+    else:
+        cellids = np.loadtxt(args.c, dtype=np.int64)
+    cellids = pt.vlsvfile.extract_region(f, args.o, args.var, cellids=np.atleast_1d(cellids), velocity_space=args.vspace)
+
+if cellids is None:
+    sys.exit(1)
+print("# " + args.o + ": " + str(len(cellids)) + " cells")
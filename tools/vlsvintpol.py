@@ -46,7 +46,6 @@ else:
 
 for filename in args.i:
     try:
-        cellids=[]
         values=[]
         f=pt.vlsvfile.VlsvReader(filename)
         f.optimize_open_file()
@@ -57,11 +56,10 @@ for filename in args.i:
                 t=f.read_parameter("t")
             except:
                 print "Unknown time format in file"
-        for coord in coords:
-            if(args.re):
-                cellids.append(f.get_cellid(coord * 6371000))
-            else:
-                cellids.append(f.get_cellid(coord))
+        if(args.re):
+            cellids = f.get_cellid(coords * 6371000)
+        else:
+            cellids = f.get_cellid(coords)
 
         for i,var in enumerate(variables):
             values.append(f.read_variable(variables[i],operator=operators[i],cellids=cellids))